@@ -0,0 +1,95 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''Micro-benchmark of the DV360/CM conversions payload builder.
+
+Compares the columnar builder with the previous iterrows builder on
+synthetic rows shaped like get_push_conversions.sql. Only pyarrow,
+pandas and numpy are needed:
+
+    python backend/benchmarks/dv360_cm_conversions_benchmark.py --rows 1000000
+'''
+
+import argparse
+import importlib.util
+import os
+import time
+import numpy as np
+import pyarrow as pa
+
+BATCH_SIZE = 1000
+BUILDER_PATH = os.path.join(os.path.dirname(__file__), os.pardir,
+                            'core', 'services', 'destinations', 'dv360_cm_conversions.py')
+
+def load_builder():
+    '''Loads the builder module from its file, importing the core package
+    would start the Flask app and the Cloud Logging client.'''
+    spec = importlib.util.spec_from_file_location('dv360_cm_conversions', BUILDER_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def build_table(rows):
+    rng = np.random.default_rng(0)
+    start_micros = 1_700_000_000_000_000
+    return pa.table({
+        'dclid': pa.array([f'CJ{index:020d}' for index in range(rows)]),
+        'conversion_name': pa.array(['retailer_purchase_Co-Op4All'] * rows),
+        'conversion_timestamp': pa.array(start_micros + np.sort(rng.integers(0, 5 * 86400 * 10**6, rows))),
+        'conversion_quantity': pa.array(rng.integers(1, 5, rows)),
+        'conversion_value': pa.array(rng.random(rows) * 100),
+        'currency_code': pa.array(['USD'] * rows)
+    })
+
+def build_conversions_iterrows(conversions, floodlight_activity_id, floodlight_configuration_id):
+    '''The previous row by row builder, kept as the baseline.'''
+    conversions_upload = []
+    for index, conversion in conversions.iterrows():
+        conversions_upload.append({
+            'kind': 'dfareporting#conversion',
+            'floodlightActivityId': floodlight_activity_id,
+            'floodlightConfigurationId': floodlight_configuration_id,
+            'ordinal': 1,
+            'timestampMicros': conversion['conversion_timestamp'] * 10e5,
+            'dclid': conversion['dclid'],
+            'quantity': conversion['conversion_quantity'],
+            'value': conversion['conversion_value']
+        })
+    return conversions_upload
+
+def run(name, batches, build):
+    start = time.perf_counter()
+    rows = 0
+    for record_batch in batches:
+        rows += len(build(record_batch, 1234, 5678))
+    elapsed = time.perf_counter() - start
+    print(f'{name:<10} {rows:>10,} rows {elapsed:>8.2f}s {rows / elapsed:>12,.0f} rows/s')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--baseline-rows', type=int, default=100_000,
+                        help='Rows for the iterrows baseline, 0 to skip it.')
+    args = parser.parse_args()
+
+    builder = load_builder()
+    table = build_table(args.rows)
+    run('columnar', table.to_batches(max_chunksize=BATCH_SIZE), builder.build_conversions)
+    if args.baseline_rows:
+        baseline = table.slice(0, args.baseline_rows).to_batches(max_chunksize=BATCH_SIZE)
+        run('iterrows', baseline,
+            lambda record_batch, *ids: build_conversions_iterrows(record_batch.to_pandas(), *ids))
+
+if __name__ == '__main__':
+    main()
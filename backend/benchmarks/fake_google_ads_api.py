@@ -0,0 +1,147 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''Local fake of the Google Ads API conversion upload endpoints.
+
+Answers the conversion_action search and UploadClickConversions with
+partial failure, with an optional latency, rate of 429 responses and rate
+of rejected conversions, to exercise the Google Ads API push without a
+Google Ads account. Only the standard library is needed:
+
+    python backend/benchmarks/fake_google_ads_api.py --port 8089 --latency 0.2 --failure-rate 0.1
+
+and point the backend at it with GOOGLE_ADS_API_ENDPOINT=http://localhost:8089.
+'''
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SEARCH_PATH = re.compile(r'^/v\d+/customers/(\d+)/googleAds:search$')
+UPLOAD_PATH = re.compile(r'^/v\d+/customers/(\d+):uploadClickConversions$')
+MAX_CONVERSIONS = 2000
+
+class FakeGoogleAdsHandler(BaseHTTPRequestHandler):
+    '''Handles the requests of the fake, configured through the server attributes.'''
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        if not self.headers.get('developer-token'):
+            return self.send_json(401, error(401, 'UNAUTHENTICATED', 'Missing developer token.'))
+        time.sleep(self.server.latency)
+        search = SEARCH_PATH.match(self.path)
+        if search:
+            return self.send_json(200, self.search(search.group(1)))
+        upload = UPLOAD_PATH.match(self.path)
+        if not upload:
+            return self.send_json(404, error(404, 'NOT_FOUND', f'Unknown method {self.path}.'))
+        if random.random() < self.server.failure_rate:
+            self.server.count('throttled')
+            return self.send_json(429, error(429, 'RESOURCE_EXHAUSTED', 'Too many requests.'))
+        conversions = body.get('conversions', [])
+        if len(conversions) > MAX_CONVERSIONS:
+            return self.send_json(400, error(400, 'INVALID_ARGUMENT', 'Too many conversions.'))
+        self.send_json(200, self.upload(upload.group(1), conversions, body.get('partialFailure')))
+
+    def search(self, customer_id):
+        return {'results': [{
+            'conversionAction': {
+                'resourceName': f'customers/{customer_id}/conversionActions/{index + 1}',
+                'name': name
+            }
+        } for index, name in enumerate(self.server.conversion_actions)]}
+
+    def upload(self, customer_id, conversions, partial_failure):
+        errors = []
+        for index, conversion in enumerate(conversions):
+            if random.random() < self.server.rejection_rate:
+                errors.append({
+                    'errorCode': {'conversionUploadError': 'UNPARSEABLE_GCLID'},
+                    'message': 'The click ID could not be decoded.',
+                    'location': {'fieldPathElements': [
+                        {'fieldName': 'conversions', 'index': index},
+                        {'fieldName': 'gclid'}
+                    ]}
+                })
+        self.server.count('uploaded', len(conversions) - len(errors))
+        self.server.count('rejected', len(errors))
+        response = {'results': [{'gclid': conversion.get('gclid')} for conversion in conversions]}
+        if errors and partial_failure:
+            response['partialFailureError'] = {
+                'code': 3,
+                'message': f'{len(errors)} conversions failed.',
+                'details': [{
+                    '@type': 'type.googleapis.com/google.ads.googleads.v20.errors.GoogleAdsFailure',
+                    'errors': errors
+                }]
+            }
+        return response
+
+    def send_json(self, status, body):
+        content = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+class FakeGoogleAdsServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency, failure_rate, rejection_rate, conversion_actions):
+        super().__init__(address, FakeGoogleAdsHandler)
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.rejection_rate = rejection_rate
+        self.conversion_actions = conversion_actions
+        self.counters = {'throttled': 0, 'uploaded': 0, 'rejected': 0}
+        self.__lock = threading.Lock()
+
+    def count(self, name, value=1):
+        with self.__lock:
+            self.counters[name] += value
+
+def error(code, status, message):
+    return {'error': {'code': code, 'status': status, 'message': message}}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to each response.')
+    parser.add_argument('--failure-rate', type=float, default=0.0,
+                        help='Share of the uploads answered with a 429.')
+    parser.add_argument('--rejection-rate', type=float, default=0.0,
+                        help='Share of the conversions rejected as partial failures.')
+    parser.add_argument('--conversion-actions', nargs='*', default=[],
+                        help='Names of the enabled conversion actions, e.g. retailer_purchase_Co-Op4All.')
+    args = parser.parse_args()
+    server = FakeGoogleAdsServer(('localhost', args.port), args.latency, args.failure_rate,
+                                 args.rejection_rate, args.conversion_actions)
+    print(f'Fake Google Ads API listening on http://localhost:{args.port}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f'Fake Google Ads API counters: {server.counters}')
+
+if __name__ == '__main__':
+    main()
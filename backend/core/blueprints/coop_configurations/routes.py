@@ -12,7 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from flask import jsonify, request
+from flask import jsonify, request, Response, stream_with_context
 import utils
 from . import coop_configurations
 from pydantic import ValidationError
@@ -27,6 +27,11 @@ logger = utils.get_coop_logger(LOGGER_NAME)
 @coop_configurations.route("/api/co_op_campaigns", methods=["GET"])
 def list_co_op_campaigns():
     try:
+        list_params = utils.get_list_params(request.args)
+        # Without query params the full list is returned, as the list views expect.
+        if any(value is not None for value in list_params.values()):
+            page = coop_service.list_configs('CoopCampaignConfig', **list_params)
+            return jsonify(page)
         configs = coop_service.get_all('CoopCampaignConfig')
         if not configs:
             raise CoopException('The Co-Op configs were not found.', status_code=404)
@@ -97,6 +102,29 @@ def delete_co_op_campaign(name):
         logger.error('Co-Op Configs Route - %s' % (error['message']))
         raise CoopException(error['message'], status_code=error['status_code'])
 
+@coop_configurations.route("/api/co_op_campaigns/bulk", methods=["POST"])
+def import_co_op_campaigns():
+    try:
+        data_format = utils.get_bulk_format(request)
+        report = coop_service.import_configs('CoopCampaignConfig', request.get_data(as_text=True), data_format)
+        return jsonify(report), 200
+    except Exception as error:
+        error = utils.build_error(error)
+        logger.error('Co-Op Configs Route - %s' % (error['message']))
+        raise CoopException(error['message'], status_code=error['status_code'])
+
+@coop_configurations.route("/api/co_op_campaigns/export", methods=["GET"])
+def export_co_op_campaigns():
+    try:
+        data_format = utils.get_bulk_format(request)
+        lines = coop_service.export_configs('CoopCampaignConfig', data_format)
+        mimetype = 'text/csv' if data_format == 'csv' else 'application/x-ndjson'
+        return Response(stream_with_context(lines), status=200, mimetype=mimetype)
+    except Exception as error:
+        error = utils.build_error(error)
+        logger.error('Co-Op Configs Route - %s' % (error['message']))
+        raise CoopException(error['message'], status_code=error['status_code'])
+
 # Exception Handler
 @coop_configurations.errorhandler(CoopException)
 def handle_coop_exception(error):
@@ -12,7 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from flask import jsonify, request
+from flask import jsonify, request, Response, stream_with_context
 import utils
 from . import retailers
 from pydantic import ValidationError
@@ -27,6 +27,11 @@ logger = utils.get_coop_logger(LOGGER_NAME)
 @retailers.route("/api/retailers", methods=["GET"])
 def list_retailers():
     try:
+        list_params = utils.get_list_params(request.args)
+        # Without query params the full list is returned, as the list views expect.
+        if any(value is not None for value in list_params.values()):
+            page = coop_service.list_configs('RetailerConfig', **list_params)
+            return jsonify(page)
         configs = coop_service.get_all('RetailerConfig')
         if not configs:
             raise CoopException('The retailers were not found.', status_code=404)
@@ -97,6 +102,56 @@ def delete_retailer(name):
         logger.error('Retailers Route - %s' % (error['message']))
         raise CoopException(error['message'], status_code=error['status_code'])
 
+@retailers.route("/api/retailers/<string:name>/backfill", methods=["POST"])
+def backfill_retailer(name):
+    try:
+        data = request.get_json(silent=True) or {}
+        backfill = coop_service.backfill_retailer(name,
+                                                  chunk_days=utils.get_positive_int_param(data, 'chunk_days'),
+                                                  max_workers=utils.get_positive_int_param(data, 'max_workers'),
+                                                  restart=data.get('restart', False))
+        # The backfill runs in the background, its progress is read with GET.
+        return jsonify(backfill), 202
+    except Exception as error:
+        error = utils.build_error(error)
+        logger.error('Retailers Route - %s' % (error['message']))
+        raise CoopException(error['message'], status_code=error['status_code'])
+
+@retailers.route("/api/retailers/<string:name>/backfill", methods=["GET"])
+def get_retailer_backfill(name):
+    try:
+        backfill = coop_service.get_backfill_status(name)
+        if not backfill:
+            raise CoopException('The retailer backfill was not found.', status_code=404)
+        return jsonify(backfill)
+    except Exception as error:
+        error = utils.build_error(error)
+        logger.error('Retailers Route - %s' % (error['message']))
+        raise CoopException(error['message'], status_code=error['status_code'])
+
+@retailers.route("/api/retailers/bulk", methods=["POST"])
+def import_retailers():
+    try:
+        data_format = utils.get_bulk_format(request)
+        report = coop_service.import_configs('RetailerConfig', request.get_data(as_text=True), data_format)
+        return jsonify(report), 200
+    except Exception as error:
+        error = utils.build_error(error)
+        logger.error('Retailers Route - %s' % (error['message']))
+        raise CoopException(error['message'], status_code=error['status_code'])
+
+@retailers.route("/api/retailers/export", methods=["GET"])
+def export_retailers():
+    try:
+        data_format = utils.get_bulk_format(request)
+        lines = coop_service.export_configs('RetailerConfig', data_format)
+        mimetype = 'text/csv' if data_format == 'csv' else 'application/x-ndjson'
+        return Response(stream_with_context(lines), status=200, mimetype=mimetype)
+    except Exception as error:
+        error = utils.build_error(error)
+        logger.error('Retailers Route - %s' % (error['message']))
+        raise CoopException(error['message'], status_code=error['status_code'])
+
 # Exception Handler
 @retailers.errorhandler(CoopException)
 def handle_coop_exception(error):
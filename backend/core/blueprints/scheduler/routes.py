@@ -12,11 +12,14 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from flask import jsonify, Response
+from flask import jsonify, request, Response, stream_with_context
 import utils
 from . import scheduler
 from core.exceptions.coop_exception import CoopException
-from core.services.coop_service import CoopService
+from core.services.conversions_cache import snapshot_cache
+from core.services.coop_service import BYTES_REPORT_MAX_DAYS, CoopService
+from core.services.destinations.cm_client_factory import cm_client_factory
+from core.services.sql_template_registry import registry
 
 coop_service = CoopService()
 LOGGER_NAME = 'coop4all.scheduler_route'
@@ -26,11 +29,35 @@ logger = utils.get_coop_logger(LOGGER_NAME)
 def update_all_configs():
     '''Endpoint to update all the Co-Op Configurations by checking if
     the Google Analytics data is available.
+
+        Query params:
+        max_workers (int): Optional limit of retailers refreshed concurrently.
+
+        Returns:
+        results (list): The update summary per retailer.
+    '''
+
+    try:
+        max_workers = utils.get_positive_int_param(request.args, 'max_workers')
+        results = coop_service.update_all(max_workers=max_workers)
+        return jsonify(results), 200
+    except Exception as error:
+        error = utils.build_error(error)
+        logger.error('Scheduler Route - %s' % (error['message']))
+        raise CoopException(error['message'], status_code=error['status_code'])
+
+@scheduler.route("/api/scheduler/resume_backfills", methods=["GET"])
+def resume_backfills():
+    '''Endpoint to restart the retailer backfills that were interrupted
+    while running.
+
+        Returns:
+        backfills (list): The progress of each resumed backfill.
     '''
 
     try:
-        coop_service.update_all()
-        return "", 200
+        backfills = coop_service.resume_backfills()
+        return jsonify(backfills), 200
     except Exception as error:
         error = utils.build_error(error)
         logger.error('Scheduler Route - %s' % (error['message']))
@@ -39,25 +66,39 @@ def update_all_configs():
 @scheduler.route("/api/scheduler/get_google_ads_conversions/<string:name>", methods=["GET"])
 def get_google_ads_conversions(name):
     '''Endpoint to retrieve the Google Ads conversions for
-    the specified Co-Op Configuration.
+    the specified Co-Op Configuration. Responses carry an ETag, a request
+    with a matching If-None-Match gets a 304 without running the query.
 
         Args:
         name (str): The Co-Op Configuration name.
 
         Returns:
-        conversions (str): a list of Google Ads conversions in csv format.
+        conversions (str): a list of Google Ads conversions in csv format,
+        streamed with chunked transfer encoding.
     '''
     try:
-        conversions = coop_service.get_google_ads_conversions(name)
+        # Weak ETags also match, the frontend weakens them when it compresses the response.
+        if_none_match = request.if_none_match.as_set(include_weak=True)
+        conversions, etag = coop_service.get_google_ads_conversions(name, if_none_match)
+        if conversions is None:
+            response = Response(status=304)
+            response.set_etag(etag)
+            logger.info(f'Scheduler Configs Route - get_google_ads_conversions - ' \
+            f'Conversions for the Co-Op Config {name} were not modified.')
+            return response
         if conversions:
-            response = Response(response=conversions,
+            response = Response(response=stream_with_context(conversions),
                                 status=200, mimetype="text/csv")
             response.headers["Content-Type"] = "text/csv"
+            if etag:
+                response.set_etag(etag)
+                # Clients may keep the export but must revalidate it.
+                response.headers["Cache-Control"] = "no-cache"
             logger.info(f'Scheduler Configs Route - get_google_ads_conversions - ' \
-            f'Conversions for the Co-Op Config {name} were sent successfully to Google Ads!')
+            f'Streaming the conversions for the Co-Op Config {name} to Google Ads.')
             return response
         else:
-            logger.log(f'Scheduler Configs Route - get_google_ads_conversions - ' \
+            logger.info(f'Scheduler Configs Route - get_google_ads_conversions - ' \
             f'Conversions not found for the Co-Op Config {name}')
             return f'Conversions not found for the Co-Op Config {name}', 204
     except Exception as error:
@@ -65,19 +106,171 @@ def get_google_ads_conversions(name):
         logger.error('Scheduler Configs Route - %s' % (error['message']))
         raise CoopException(error['message'], status_code=error['status_code'])
 
+@scheduler.route("/api/scheduler/get_google_ads_bulk_conversions", methods=["GET"])
+def get_google_ads_bulk_conversions():
+    '''Endpoint to retrieve the Google Ads conversions of several Co-Op
+    Configurations with a single query, so a daily import of many configs
+    runs one BigQuery job. Responses carry an ETag like the single config export.
+
+        Query params:
+        name (str): Repeatable, the Co-Op Configuration names.
+        customer_id (str): The Google Ads customer id, exports all its Co-Op
+        Configurations when no name is sent.
+        format (str): Optional, "combined" (default) for a single csv or
+        "sections" for one csv section per Co-Op Configuration.
+
+        Returns:
+        conversions (str): the Google Ads conversions in csv format,
+        streamed with chunked transfer encoding.
+    '''
+    try:
+        names = request.args.getlist('name')
+        customer_id = request.args.get('customer_id')
+        export_format = request.args.get('format', default='combined').lower()
+        if export_format not in ('combined', 'sections'):
+            raise CoopException(f'Unknown conversions format: {export_format}.', status_code=400)
+        if_none_match = request.if_none_match.as_set(include_weak=True)
+        conversions, etag = coop_service.get_google_ads_bulk_conversions(
+            names=names, customer_id=customer_id, sections=export_format == 'sections',
+            if_none_match=if_none_match)
+        description = ', '.join(names) if names else f'customer {customer_id}'
+        if conversions is None:
+            response = Response(status=304)
+            response.set_etag(etag)
+            logger.info(f'Scheduler Configs Route - get_google_ads_bulk_conversions - ' \
+            f'Conversions for {description} were not modified.')
+            return response
+        if conversions:
+            response = Response(response=stream_with_context(conversions),
+                                status=200, mimetype="text/csv")
+            response.headers["Content-Type"] = "text/csv"
+            response.set_etag(etag)
+            response.headers["Cache-Control"] = "no-cache"
+            logger.info(f'Scheduler Configs Route - get_google_ads_bulk_conversions - ' \
+            f'Streaming the conversions for {description} to Google Ads.')
+            return response
+        else:
+            logger.info(f'Scheduler Configs Route - get_google_ads_bulk_conversions - ' \
+            f'Conversions not found for {description}')
+            return f'Conversions not found for {description}', 204
+    except Exception as error:
+        error = utils.build_error(error)
+        logger.error('Scheduler Configs Route - %s' % (error['message']))
+        raise CoopException(error['message'], status_code=error['status_code'])
+
+@scheduler.route("/api/scheduler/push_conversions", methods=["GET"])
+def push_conversions():
+    '''Endpoint to push the conversions of all the Co-Op Configurations to
+    all their push destinations, reading the conversions of each config once
+
+        Query params:
+        destination_type (str): Optional, repeatable, only pushes to the
+        destinations of these types, e.g. dv360 or google_ads_api.
+        max_workers (int): Optional limit of Co-Op configs pushed concurrently.
+        force_resend (bool): Optional, true to send again the DV360/CM
+        conversions already uploaded.
+
+        Returns:
+        results (list): The upload outcome per Co-Op config, destination and batch.
+    '''
+
+    try:
+        destination_types = request.args.getlist('destination_type') or None
+        unknown_types = set(destination_types or []) - set(coop_service.destinations.types())
+        if unknown_types:
+            raise CoopException(f'Unknown push destination types: {", ".join(sorted(unknown_types))}.',
+                                status_code=400)
+        max_workers = utils.get_positive_int_param(request.args, 'max_workers')
+        force_resend = request.args.get('force_resend', default='false').lower() == 'true'
+        results = coop_service.push_conversions(destination_types=destination_types,
+                                                max_workers=max_workers, force_resend=force_resend)
+        return jsonify(results), 200
+    except Exception as error:
+        error = utils.build_error(error)
+        logger.error('Scheduler Route - %s' % (error['message']))
+        raise CoopException(error['message'], status_code=error['status_code'])
+
 @scheduler.route("/api/scheduler/push_dv360_cm_conversions", methods=["GET"])
 def push_dv360_cm_conversions():
-    '''Endpoint to push the DV360/CM conversions for all the Co-Op Configurations'''
+    '''Endpoint to push the DV360/CM conversions for all the Co-Op Configurations
+
+        Query params:
+        max_workers (int): Optional limit of Co-Op configs pushed concurrently.
+        force_resend (bool): Optional, true to send again the conversions
+        already uploaded, e.g. to recover from a CM issue.
+
+        Returns:
+        results (list): The upload outcome per Co-Op config and batch.
+    '''
 
     try:
-        coop_service.push_dv360_cm_conversions()
-        return f'The conversions for all the Co-Op Configs were processed! ' \
-        f'Please check the logs in case there is any error.', 200
+        max_workers = utils.get_positive_int_param(request.args, 'max_workers')
+        force_resend = request.args.get('force_resend', default='false').lower() == 'true'
+        results = coop_service.push_dv360_cm_conversions(max_workers=max_workers,
+                                                         force_resend=force_resend)
+        return jsonify(results), 200
     except Exception as error:
         error = utils.build_error(error)
         logger.error('Scheduler Route - %s' % (error['message']))
         raise CoopException(error['message'], status_code=error['status_code'])
 
+@scheduler.route("/api/scheduler/push_google_ads_conversions", methods=["GET"])
+def push_google_ads_conversions():
+    '''Endpoint to push the click conversions with the Google Ads API for
+    all the Co-Op Configurations with a google_ads_api destination
+
+        Query params:
+        max_workers (int): Optional limit of Co-Op configs pushed concurrently.
+
+        Returns:
+        results (list): The upload outcome per Co-Op config and batch.
+    '''
+
+    try:
+        max_workers = utils.get_positive_int_param(request.args, 'max_workers')
+        results = coop_service.push_google_ads_conversions(max_workers=max_workers)
+        return jsonify(results), 200
+    except Exception as error:
+        error = utils.build_error(error)
+        logger.error('Scheduler Route - %s' % (error['message']))
+        raise CoopException(error['message'], status_code=error['status_code'])
+
+@scheduler.route("/api/scheduler/bytes_scanned_report", methods=["GET"])
+def bytes_scanned_report():
+    '''Endpoint to retrieve the daily bytes scanned by the Co-Op jobs,
+    e.g. to compare the coop builds before and after a table migration.
+
+        Query params:
+        days (int): Number of days to include, 14 by default and up to 180.
+
+        Returns:
+        report (list): The bytes scanned per day, job type and retailer. The
+        jobs run before the job labels are reported as unlabeled_script and
+        unlabeled_create_table_as_select, the coop builds of that time.
+    '''
+
+    try:
+        days = utils.get_positive_int_param(request.args, 'days', maximum=BYTES_REPORT_MAX_DAYS) or 14
+        report = coop_service.get_jobs_bytes_report(days)
+        return jsonify(report), 200
+    except Exception as error:
+        error = utils.build_error(error)
+        logger.error('Scheduler Route - %s' % (error['message']))
+        raise CoopException(error['message'], status_code=error['status_code'])
+
+@scheduler.route("/api/scheduler/stats", methods=["GET"])
+def stats():
+    '''Endpoint to retrieve the process-local counters of the Datastore
+    config cache, the sql template registry, the Campaign Manager clients
+    and the Google Ads conversions snapshots.'''
+
+    return jsonify({
+        'datastore_cache': coop_service.ds_client.get_stats(),
+        'sql_templates': registry.get_stats(),
+        'cm_clients': cm_client_factory.get_stats(),
+        'conversions_snapshots': snapshot_cache.get_stats()
+    }), 200
+
 # Exception Handler
 @scheduler.errorhandler(CoopException)
 def handle_coop_exception(error):
@@ -15,7 +15,7 @@
 from datetime import datetime, timezone
 from typing import List, Optional, Union
 from pydantic import BaseModel, conint, conlist, constr, validator
-from core.models.destinations import Dv360Destination, GoogleAdsDestination
+from core.models.destinations import Dv360Destination, GoogleAdsApiDestination, GoogleAdsDestination
 
 
 class Filter(BaseModel):
@@ -48,7 +48,7 @@ class CoopCampaignConfig(BaseModel):
     retailer_name: constr(regex="^[A-Za-z0-9\_]{3,50}$")
     utm_campaigns: conlist(str, min_items=1)
     filters: List[Filter]
-    destinations: Optional[List[Union[GoogleAdsDestination, Dv360Destination]]]
+    destinations: Optional[List[Union[GoogleAdsDestination, GoogleAdsApiDestination, Dv360Destination]]]
     attribution_window: conint(ge=1, le=30) = 7
     is_active: bool = True
     created_at: datetime = None
@@ -12,7 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from typing import Literal
+from typing import Literal, Optional, get_args
 from pydantic import BaseModel, constr
 
 
@@ -21,8 +21,20 @@ class GoogleAdsDestination(BaseModel):
     customer_id: constr(regex="^([0-9]{3})-([0-9]{3})-([0-9]{4})$")
 
 
+class GoogleAdsApiDestination(BaseModel):
+    type: Literal["google_ads_api"]
+    customer_id: constr(regex="^([0-9]{3})-([0-9]{3})-([0-9]{4})$")
+    # Manager account used to access the customer, if any.
+    login_customer_id: Optional[constr(regex="^([0-9]{3})-([0-9]{3})-([0-9]{4})$")]
+
+
 class Dv360Destination(BaseModel):
     type: Literal["dv360"]
     floodlight_activity_id: constr(regex="^[0-9]{3,11}$")
     floodlight_configuration_id: constr(regex="^[0-9]{3,11}$")
     cm_profile_id: constr(regex="^[0-9]{3,11}$")
+
+
+def get_destination_type(destination_model):
+    """Returns the type discriminator of a destination model, e.g. "dv360"."""
+    return get_args(destination_model.__annotations__["type"])[0]
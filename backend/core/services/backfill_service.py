@@ -0,0 +1,242 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import date, datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+import utils
+from core.exceptions.coop_exception import CoopException
+
+LOGGER_NAME = 'coop4all.backfill_service'
+logger = utils.get_coop_logger(LOGGER_NAME)
+BACKFILL_CHUNK_DAYS = int(os.environ.get('BACKFILL_CHUNK_DAYS', 7))
+BACKFILL_MAX_WORKERS = int(os.environ.get('BACKFILL_MAX_WORKERS', 4))
+# A running backfill not saved for this long was interrupted, e.g. by an instance shutdown.
+BACKFILL_STALE_MINUTES = int(os.environ.get('BACKFILL_STALE_MINUTES', 60))
+# A running backfill is saved at least this often, well within BACKFILL_STALE_MINUTES.
+BACKFILL_HEARTBEAT_SECONDS = int(os.environ.get('BACKFILL_HEARTBEAT_SECONDS', 300))
+MODEL_TYPE = 'RetailerBackfill'
+# create_retailer_bqtables.sql loads the last 3 days, update_retailer_bqtables.sql the following ones.
+CREATED_DAYS = 3
+
+class BackfillService():
+    '''
+    Service that backfills the retailer tables up to coop_max_backfill days.
+    The date range is split in chunks that run with bounded concurrency in a
+    background thread, the progress of each chunk is saved in Datastore so an
+    interrupted backfill resumes with the chunks that are not done. Once all
+    the chunks are done the coop tables of the retailer are rebuilt, since
+    their incremental refresh never goes back to the backfilled days.
+
+        Attributes:
+            bq_client: A service to handle all the BigQuery operations.
+            ds_client: A service to handle all the Datastore operations.
+    '''
+
+    def __init__(self, bq_client, ds_client):
+        self.bq_client = bq_client
+        self.ds_client = ds_client
+
+    def get_status(self, retailer_name):
+        """Gets the backfill progress of a retailer.
+
+        Args:
+            retailer_name (str): The retailer name.
+
+        Returns:
+            backfill (datastore.Entity): The backfill progress, None if
+            the retailer was never backfilled.
+        """
+
+        return self.ds_client.get_by_name(MODEL_TYPE, retailer_name)
+
+    def __plan(self, retailer_config, chunk_days):
+        """Splits the backfill range in chunks, the most recent days first.
+        The range ends before the days loaded when the retailer was created,
+        so it never overlaps with the daily updates, and starts
+        coop_max_backfill days ago.
+
+        Returns:
+            backfill (dict): The new backfill progress.
+        """
+
+        time_zone = retailer_config.get('time_zone')
+        today = datetime.now(ZoneInfo(time_zone)).date()
+        end_date = today - timedelta(days=CREATED_DAYS + 1)
+        # Partitions older than coop_max_backfill days expire, the oldest one is skipped.
+        start_date = today - timedelta(days=retailer_config.get('coop_max_backfill') - 1)
+        chunks = []
+        chunk_end = end_date
+        while chunk_end >= start_date:
+            chunk_start = max(start_date, chunk_end - timedelta(days=chunk_days - 1))
+            chunks.append({
+                'from_date': chunk_start.isoformat(),
+                'to_date': chunk_end.isoformat(),
+                'status': 'pending',
+                'error': None
+            })
+            chunk_end = chunk_start - timedelta(days=1)
+        return {
+            'name': retailer_config.get('name'),
+            'start_date': start_date.isoformat(),
+            'end_date': end_date.isoformat(),
+            'status': 'pending',
+            'chunks': chunks,
+            'created_at': datetime.now(timezone.utc),
+            'modified_at': datetime.now(timezone.utc)
+        }
+
+    def __run_chunk(self, retailer_config, chunk):
+        self.bq_client.backfill(retailer_config,
+                                date.fromisoformat(chunk['from_date']),
+                                date.fromisoformat(chunk['to_date']))
+
+    def is_stale(self, backfill):
+        """Whether a running backfill was interrupted, its chunks left
+        running are then retried.
+
+        Args:
+            backfill (dict): The backfill progress.
+
+        Returns:
+            stale (bool): True if the backfill is running but was not saved
+            for BACKFILL_STALE_MINUTES.
+        """
+
+        return backfill['status'] == 'running' and \
+            datetime.now(timezone.utc) - backfill['modified_at'] > timedelta(minutes=BACKFILL_STALE_MINUTES)
+
+    def start(self, retailer_config, coop_configs, chunk_days=None, max_workers=None, restart=False):
+        """Starts the chunks of the retailer backfill that are not done yet
+        in a background thread. A new backfill is planned if there is none or
+        restart is set.
+
+        Args:
+            retailer_config (dict): Retailer parameters.
+            coop_configs (list): The active coop configs of the retailer,
+            rebuilt once all the chunks are done.
+            chunk_days (int): Number of days per chunk for a new backfill.
+            max_workers (int): Maximum number of chunks running at the same time.
+            restart (bool): Discards the saved progress and plans a new backfill.
+
+        Returns:
+            backfill (dict): The backfill progress when it started.
+
+        Raises:
+            CoopException: 409 if the backfill of the retailer is already running.
+        """
+
+        retailer_name = retailer_config.get('name')
+        backfill = self.get_status(retailer_name)
+        if backfill and backfill['status'] == 'running' and not self.is_stale(backfill):
+            raise CoopException('BackfillService - start - ' \
+                f'The backfill of retailer {retailer_name} is already running.', status_code=409)
+        if not backfill or restart:
+            backfill = self.__plan(retailer_config, chunk_days or BACKFILL_CHUNK_DAYS)
+        backfill = dict(backfill)
+        backfill['chunks'] = [dict(chunk) for chunk in backfill['chunks']]
+        backfill['max_workers'] = max_workers or backfill.get('max_workers') or BACKFILL_MAX_WORKERS
+        # Chunks left running by an interrupted backfill are retried, loading a chunk is idempotent.
+        pending = [chunk for chunk in backfill['chunks'] if chunk['status'] != 'done']
+        logger.info(f'BackfillService - Backfilling retailer {retailer_name}: ' \
+            f'{len(pending)} of {len(backfill["chunks"])} chunks pending ' \
+            f'with {backfill["max_workers"]} workers...')
+        backfill['status'] = 'running'
+        for chunk in pending:
+            chunk['status'] = 'running'
+        self.__save(backfill)
+        progress = dict(backfill, chunks=[dict(chunk) for chunk in backfill['chunks']])
+        threading.Thread(target=self.__run, args=(retailer_config, coop_configs, backfill, pending),
+                         daemon=True).start()
+        return progress
+
+    def __run(self, retailer_config, coop_configs, backfill, pending):
+        retailer_name = retailer_config.get('name')
+        # Progress is saved from this thread only, so the entity is never written concurrently.
+        with ThreadPoolExecutor(max_workers=backfill['max_workers']) as executor:
+            futures = {executor.submit(self.__run_chunk, retailer_config, chunk): chunk
+                       for chunk in pending}
+            for future in self.__wait(backfill, futures):
+                chunk = futures[future]
+                try:
+                    future.result()
+                    chunk['status'] = 'done'
+                    chunk['error'] = None
+                except Exception as error:
+                    chunk['status'] = 'error'
+                    chunk['error'] = utils.build_error(error)['message']
+                    logger.error(f'BackfillService - Error backfilling retailer {retailer_name} ' \
+                        f'from {chunk["from_date"]} to {chunk["to_date"]}: {chunk["error"]}')
+                self.__save(backfill)
+
+        failed = [chunk for chunk in backfill['chunks'] if chunk['status'] != 'done']
+        backfill['coop_configs_failed'] = []
+        if not failed:
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                future = executor.submit(self.__rebuild_coop_tables, retailer_config, coop_configs)
+                backfill['coop_configs_failed'] = next(self.__wait(backfill, [future])).result()
+        backfill['status'] = 'error' if failed or backfill['coop_configs_failed'] else 'done'
+        self.__save(backfill)
+        logger.info(f'BackfillService - Backfill of retailer {retailer_name} finished ' \
+            f'with status {backfill["status"]}.')
+
+    def __wait(self, backfill, futures):
+        '''Yields the futures as they complete. Meanwhile the backfill is saved
+        every BACKFILL_HEARTBEAT_SECONDS, so a long chunk or rebuild never looks stale.'''
+        not_done = set(futures)
+        while not_done:
+            done, not_done = wait(not_done, timeout=BACKFILL_HEARTBEAT_SECONDS, return_when=FIRST_COMPLETED)
+            if not done:
+                self.__save(backfill)
+            yield from done
+
+    def __rebuild_coop_tables(self, retailer_config, coop_configs):
+        """Rebuilds the coop tables of the retailer from the backfilled days.
+
+        Returns:
+            coop_configs_failed (list): The coop configs that could not be rebuilt and their error.
+        """
+
+        if not coop_configs:
+            return []
+        coop_configs = [dict(coop_config, incremental=False) for coop_config in coop_configs]
+        try:
+            failed_configs = self.bq_client.update_coop_batch(retailer_config, coop_configs)
+        except Exception as error:
+            message = utils.build_error(error)['message']
+            failed_configs = {coop_config['name']: message for coop_config in coop_configs}
+        for name, error in failed_configs.items():
+            logger.error(f'BackfillService - Error rebuilding coop config {name} of retailer ' \
+                f'{retailer_config.get("name")}: {error}')
+        return [{'coop_config': name, 'error': error} for name, error in failed_configs.items()]
+
+    def __save(self, backfill):
+        backfill['modified_at'] = datetime.now(timezone.utc)
+        self.ds_client.put(MODEL_TYPE, backfill)
+
+    def delete(self, retailer_name):
+        """Deletes the backfill progress of a retailer."""
+
+        return self.ds_client.delete(MODEL_TYPE, retailer_name)
+
+    def get_stale(self):
+        """Gets the running backfills that were interrupted.
+
+        Returns:
+            backfills (list): The stale backfill progresses.
+        """
+
+        return [backfill for backfill in self.ds_client.get_all(MODEL_TYPE) if self.is_stale(backfill)]
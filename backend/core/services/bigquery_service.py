@@ -12,21 +12,34 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import utils
+import io
 import os
+import pyarrow as pa
+import pyarrow.parquet as pq
+import utils
 from google.api_core.exceptions import NotFound
 from google.cloud import bigquery
-from jinja2 import Template
+from google.cloud import bigquery_storage
+from .sql_template_registry import registry
 
 LOGGER_NAME = 'coop4all.bigquery_service'
 logger = utils.get_coop_logger(LOGGER_NAME)
+READ_BATCH_SIZE = int(os.environ.get('BQ_READ_BATCH_SIZE', 10000))
+BQ_LOCATION = os.environ.get('BQ_LOCATION', 'US')
+# Account that ran the Co-Op jobs, the App Engine default service account by default.
+BQ_JOBS_USER_EMAIL = os.environ.get('BQ_JOBS_USER_EMAIL',
+                                    f'{os.environ.get("GOOGLE_CLOUD_PROJECT")}@appspot.gserviceaccount.com')
+# Suffix of the ledger table of the conversions of a coop config uploaded to DV360/CM.
+UPLOADS_LEDGER_SUFFIX = '_dv360_uploads'
 
 class BigqueryService():
     def __init__(self):
         self.client = bigquery.Client()
+        self.bqstorage_client = None
+        self.tables_metadata = {}
 
     def get_query(self, sql_file, query_params):
-        """Reads a sql file and adds query parameters.
+        """Renders the precompiled sql template with the query parameters.
 
         Args:
             sql_file (str): Path to the sql file.
@@ -36,11 +49,7 @@ class BigqueryService():
             A string representing the sql query.
         """
 
-        path = os.path.join(os.path.dirname(__file__), os.pardir, sql_file)
-        with open(path, 'r') as f:
-            file = f.read()
-        query = Template(file)
-        return query.render(params=query_params)
+        return registry.render(sql_file, query_params)
 
     def execute_query(self, sql_file, query_params):
         """Executes a query as a job and waits for the results.
@@ -73,6 +82,40 @@ class BigqueryService():
         rows_df = result.to_dataframe()
         return rows_df
 
+    def iter_table_batches(self, sql_file, query_params, batch_size=READ_BATCH_SIZE, max_queue_size=None):
+        """Gets the table data of the specified query as a stream of Arrow
+        record batches read with the BigQuery Storage Read API, so only a
+        few batches are held in memory at a time.
+
+        Args:
+            sql_file (str): The query to be executed.
+            query_params (dict): The parameters to include in the query.
+            batch_size (int): Maximum number of rows per batch.
+            max_queue_size (int): Maximum number of Storage API pages downloaded
+            ahead of the caller, one per read stream by default.
+
+        Yields:
+            batch (pyarrow.RecordBatch): A batch with at most batch_size rows.
+        """
+
+        if not self.bqstorage_client:
+            self.bqstorage_client = bigquery_storage.BigQueryReadClient()
+        query = self.get_query(sql_file, query_params)
+        result = self.client.query(query).result(page_size=batch_size)
+        if not result.total_rows:
+            # An empty result has no Storage API read streams, so nothing would be
+            # yielded. A single empty batch still gives callers the result schema.
+            schema = result.to_arrow(create_bqstorage_client=False).schema
+            yield pa.RecordBatch.from_pylist([], schema=schema)
+            return
+        download_params = {'max_queue_size': max_queue_size} if max_queue_size else {}
+        for record_batch in result.to_arrow_iterable(bqstorage_client=self.bqstorage_client,
+                                                     **download_params):
+            # Storage API streams choose their own batch size, slices are zero-copy.
+            # Empty batches are kept so callers still get the result schema.
+            for offset in range(0, max(record_batch.num_rows, 1), batch_size):
+                yield record_batch.slice(offset, batch_size)
+
     def create(self, model_type, model_params):
         """Creates the datasets and tables in BigQuery
         for a Retailer or CoopCampaign.
@@ -85,24 +128,129 @@ class BigqueryService():
 
         if model_type == 'RetailerConfig':
             query = self.get_query('sql/create_retailer_bqtables.sql', model_params)
+            job = self.submit_job(query, 'create_retailer', model_params.get('name'))
         else:
+            self.__check_coop_params(model_params)
             query = self.get_query('sql/create_or_update_coop.sql', model_params)
-        job = self.client.query(query)
+            job = self.submit_job(query, 'coop_build', model_params.get('retailer_name'))
+
+    def __check_coop_params(self, coop_params):
+        '''Coop tables expire their partitions after the coop_max_backfill days
+        of their retailer. It has no default, a shorter window would drop
+        partitions that the incremental refresh never loads again.'''
+        if not coop_params.get('coop_max_backfill'):
+            raise ValueError(f'The params of the Co-Op config {coop_params.get("name")} ' \
+                'lack the coop_max_backfill of its retailer.')
 
-    def update(self, model_type, model_params):
+    def update(self, model_type, model_params, incremental=False):
         """Updates tables in BigQuery for a Retailer or CoopCampaign.
 
         Args:
             model_type (str): The model type (CoopCampaingConfig or
             RetailerConfig).
             model_params (dict): Parameters to include in the query.
+            incremental (bool): For a CoopCampaign, merges only the new days
+            into the existing table instead of a full rebuild.
         """
 
         if model_type == 'RetailerConfig':
             query = self.get_query('sql/update_retailer_bqtables.sql', model_params)
+            job = self.submit_job(query, 'update_retailer', model_params.get('name'))
+        elif incremental:
+            self.__check_coop_params(model_params)
+            query = self.get_query('sql/merge_coop.sql', model_params)
+            job = self.submit_job(query, 'coop_build', model_params.get('retailer_name'))
         else:
+            self.__check_coop_params(model_params)
             query = self.get_query('sql/create_or_update_coop.sql', model_params)
-        job = self.client.query(query)
+            job = self.submit_job(query, 'coop_build', model_params.get('retailer_name'))
+
+    def backfill(self, retailer_config, from_date, to_date):
+        """Loads a range of days of the retailer tables and waits
+        for the job to finish.
+
+        Args:
+            retailer_config (dict): Retailer parameters.
+            from_date (date): First day of the range.
+            to_date (date): Last day of the range.
+        """
+
+        query_params = dict(retailer_config)
+        query_params['from_date'] = from_date.isoformat()
+        query_params['to_date'] = to_date.isoformat()
+        query = self.get_query('sql/backfill_retailer_bqtables.sql', query_params)
+        job = self.submit_job(query, 'backfill_retailer', query_params.get('name'))
+        job.result()
+
+    def update_coop_batch(self, retailer_config, coop_configs):
+        """Updates all the given CoopCampaign tables of a retailer in a single
+        multi-statement job over one shared clicks/transactions join.
+
+        Args:
+            retailer_config (dict): Retailer parameters.
+            coop_configs (list): CoopCampaign parameters, each one with an
+            incremental flag to merge new days instead of a full rebuild.
+            Their partitions expire after the coop_max_backfill days of the retailer.
+
+        Returns:
+            failed_configs (dict): The error of each coop config that failed,
+            the other configs were updated.
+        """
+
+        coop_max_backfill = retailer_config.get('coop_max_backfill')
+        coop_configs = [dict(coop_config, coop_max_backfill=coop_max_backfill) for coop_config in coop_configs]
+        for coop_config in coop_configs:
+            self.__check_coop_params(coop_config)
+        query_params = {
+            'retailer_name': retailer_config.get('name'),
+            'coop_max_backfill': coop_max_backfill,
+            'coop_configs': coop_configs
+        }
+        query = self.get_query('sql/batch_coop.sql', query_params)
+        job = self.submit_job(query, 'coop_build', query_params['retailer_name'])
+        return {row['coop_config']: row['error'] for row in job.result()}
+
+    def submit_job(self, query, job_type, retailer_name):
+        """Submits a query job labeled with the job type and retailer,
+        so its bytes scanned can be reported with get_jobs_bytes_report.
+
+        Args:
+            query (str): The query to be executed.
+            job_type (str): The coop_job label (e.g. coop_build).
+            retailer_name (str): The retailer label.
+
+        Returns:
+            bigquery.QueryJob: The submitted job.
+        """
+
+        # Label values only allow lowercase letters, numbers, underscores and dashes.
+        labels = {
+            'coop_job': job_type,
+            'retailer': (retailer_name or '').lower()
+        }
+        job_config = bigquery.QueryJobConfig(labels=labels)
+        return self.client.query(query, job_config=job_config)
+
+    def get_jobs_bytes_report(self, days=14):
+        """Gets the daily bytes scanned by the Co-Op jobs per job type and
+        retailer, to compare table builds before and after a change. The jobs
+        run before the coop_job labels by BQ_JOBS_USER_EMAIL are included as
+        unlabeled_script and unlabeled_create_table_as_select jobs.
+
+        Args:
+            days (int): Number of days to include in the report.
+
+        Returns:
+            report (list): A dict per day, job type and retailer.
+        """
+
+        query_params = {
+            'location': BQ_LOCATION,
+            'user_email': BQ_JOBS_USER_EMAIL,
+            'days': int(days)
+        }
+        rows = self.execute_query('sql/get_jobs_bytes_report.sql', query_params)
+        return [dict(row.items()) for row in rows]
 
     def delete(self, model_params):
         """Deletes datasets and tables for a Retailer or CoopCampaign
@@ -119,6 +267,23 @@ class BigqueryService():
         else:
             table_id = f'{retailer}.{name}'
             self.client.delete_table(table_id)
+            self.client.delete_table(f'{table_id}{UPLOADS_LEDGER_SUFFIX}', not_found_ok=True)
+
+    def append_rows(self, table_id, table):
+        """Appends the rows of an Arrow table to a BigQuery table with a
+        Parquet load job, which unlike streaming inserts is free.
+
+        Args:
+            table_id (str): The destination table, as dataset.table.
+            table (pyarrow.Table): The rows to append.
+        """
+
+        buffer = io.BytesIO()
+        pq.write_table(table, buffer)
+        buffer.seek(0)
+        job_config = bigquery.LoadJobConfig(source_format=bigquery.SourceFormat.PARQUET,
+                                            write_disposition=bigquery.WriteDisposition.WRITE_APPEND)
+        self.client.load_table_from_file(buffer, table_id, job_config=job_config).result()
 
     def get_table(self, table_name):
         """Gets a table by name.
@@ -136,3 +301,26 @@ class BigqueryService():
         except NotFound as error:
             return None
         return table
+
+    def get_tables_last_modified(self, dataset):
+        """Gets the last modified time of all the tables in a dataset
+        with one metadata query. Results are cached until
+        clear_tables_metadata is called.
+
+        Args:
+            dataset (str): Name of the dataset (retailer name).
+
+        Returns:
+            dict: Table name to last modified datetime (UTC).
+        """
+
+        if dataset not in self.tables_metadata:
+            rows = self.execute_query('sql/get_tables_metadata.sql', {'dataset': dataset})
+            self.tables_metadata[dataset] = {row.table_id: row.last_modified for row in rows}
+        return self.tables_metadata[dataset]
+
+    def clear_tables_metadata(self):
+        """Clears the cached tables metadata, it should be called at the
+        beginning of each run."""
+
+        self.tables_metadata = {}
@@ -0,0 +1,227 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import csv
+import io
+import json
+from collections import defaultdict
+from pydantic import ValidationError
+import utils
+from core.exceptions.coop_exception import CoopException
+from core.models.configurations import CoopCampaignConfig, RetailerConfig
+
+LOGGER_NAME = 'coop4all.bulk_service'
+logger = utils.get_coop_logger(LOGGER_NAME)
+MODELS = {
+    'RetailerConfig': RetailerConfig,
+    'CoopCampaignConfig': CoopCampaignConfig
+}
+
+class BulkService():
+    '''
+    Service that imports and exports retailers and Co-Op configs in bulk,
+    as NDJSON (one JSON object per line) or CSV. In CSV the list and object
+    fields (e.g. utm_campaigns, filters, destinations) are JSON encoded.
+
+        Attributes:
+            bq_client: A service to handle all the BigQuery operations.
+            ds_client: A service to handle all the Datastore operations.
+    '''
+
+    def __init__(self, bq_client, ds_client):
+        self.bq_client = bq_client
+        self.ds_client = ds_client
+
+    def parse_rows(self, body, data_format):
+        """Parses an NDJSON or CSV body into a list of dicts. A line or CSV
+        cell that is not valid JSON only fails its own row.
+
+        Args:
+            body (str): The request body.
+            data_format (str): ndjson or csv.
+
+        Returns:
+            rows (list): A dict per non empty line or CSV record.
+            parse_errors (dict): Index of each row that could not be parsed to its error.
+        """
+
+        rows = []
+        parse_errors = {}
+        if data_format == 'csv':
+            try:
+                records = list(csv.DictReader(io.StringIO(body)))
+            except csv.Error as error:
+                raise CoopException(f'The csv body could not be parsed: {error}', status_code=400)
+            for index, record in enumerate(records):
+                row = {}
+                for field, value in record.items():
+                    if value in (None, ''):
+                        continue
+                    try:
+                        row[field] = self.__parse_csv_value(value)
+                    except ValueError as error:
+                        parse_errors[index] = f'The {field} field is not valid JSON: {error}'
+                rows.append(row)
+            return rows, parse_errors
+        for index, line in enumerate(line for line in body.splitlines() if line.strip()):
+            try:
+                row = json.loads(line)
+            except ValueError as error:
+                row = None
+                parse_errors[index] = f'The line is not valid JSON: {error}'
+            if not isinstance(row, dict):
+                parse_errors.setdefault(index, 'Each NDJSON line must be a JSON object.')
+                row = {}
+            rows.append(row)
+        return rows, parse_errors
+
+    def __parse_csv_value(self, value):
+        if value[:1] in ('[', '{'):
+            return json.loads(value)
+        return value
+
+    def import_configs(self, model_type, rows, parse_errors=None):
+        """Validates all the rows, saves the valid ones with put_multi and
+        creates their BigQuery tables, batched per retailer.
+
+        Args:
+            model_type (str): The model type (CoopCampaingConfig or RetailerConfig).
+            rows (list): The config of each row.
+            parse_errors (dict): Index of each row that could not be parsed to its error.
+
+        Returns:
+            report (list): The result of each row (created, invalid, exists or error).
+        """
+
+        report = [{'row': index, 'name': row.get('name'), 'status': None, 'error': None}
+                  for index, row in enumerate(rows)]
+        for index, message in (parse_errors or {}).items():
+            self.__fail(report[index], 'invalid', message)
+        models = self.__validate(model_type, rows, report)
+        if model_type == 'RetailerConfig':
+            retailers = {}
+        else:
+            retailer_names = [model.retailer_name for model in models.values()]
+            retailers = self.ds_client.get_multi_by_name('RetailerConfig', retailer_names)
+        for index, model in list(models.items()):
+            if model_type == 'RetailerConfig' and not self.bq_client.get_table(model.bq_ga_table):
+                self.__fail(report[index], 'invalid', f'GA4 Table not found at {model.bq_ga_table}.')
+                del models[index]
+            elif model_type == 'CoopCampaignConfig' and model.retailer_name not in retailers:
+                self.__fail(report[index], 'invalid', f'The retailer {model.retailer_name} was not found.')
+                del models[index]
+
+        models_params = {index: model.dict(exclude_none=True) for index, model in models.items()}
+        created = {entity.key.name for entity in
+                   self.ds_client.add_multi(model_type, list(models_params.values()))}
+        created_params = []
+        for index, model_params in models_params.items():
+            if model_params['name'] in created:
+                report[index]['status'] = 'created'
+                created_params.append((index, model_params))
+            else:
+                self.__fail(report[index], 'exists', 'A config with the same name already exists.')
+
+        self.__create_bq_tables(model_type, created_params, retailers, report)
+        logger.info(f'BulkService - Imported {len(created_params)} of {len(rows)} {model_type} rows.')
+        return report
+
+    def __validate(self, model_type, rows, report):
+        '''Validates each row with its pydantic model, rows repeating a
+        name of the same import are invalid. Rows already failed by the
+        parsing are skipped.'''
+        models = {}
+        names = set()
+        for index, row in enumerate(rows):
+            if report[index]['status']:
+                continue
+            try:
+                model = MODELS[model_type](**row)
+            except (ValidationError, TypeError) as error:
+                self.__fail(report[index], 'invalid', f'Validation error: {error}')
+                continue
+            if model.name in names:
+                self.__fail(report[index], 'invalid', f'The name {model.name} is repeated in the import.')
+                continue
+            names.add(model.name)
+            models[index] = model
+        return models
+
+    def __create_bq_tables(self, model_type, created_params, retailers, report):
+        '''Creates the BigQuery tables of the created configs, one job per
+        retailer. A failed job only marks the rows of its retailer.'''
+        if model_type == 'RetailerConfig':
+            jobs = [(model_params['name'], [(index, model_params)])
+                    for index, model_params in created_params]
+        else:
+            by_retailer = defaultdict(list)
+            for index, model_params in created_params:
+                by_retailer[model_params['retailer_name']].append((index, model_params))
+            jobs = list(by_retailer.items())
+
+        for retailer_name, retailer_params in jobs:
+            try:
+                if model_type == 'RetailerConfig':
+                    self.bq_client.create(model_type, retailer_params[0][1])
+                else:
+                    coop_configs = [dict(model_params, incremental=False)
+                                    for index, model_params in retailer_params]
+                    failed_configs = self.bq_client.update_coop_batch(retailers[retailer_name], coop_configs)
+                    for index, model_params in retailer_params:
+                        if model_params['name'] in failed_configs:
+                            self.__fail(report[index], 'error', failed_configs[model_params['name']])
+            except Exception as error:
+                message = utils.build_error(error)['message']
+                logger.error(f'BulkService - Error creating the BigQuery tables of {retailer_name}: {message}')
+                for index, model_params in retailer_params:
+                    self.__fail(report[index], 'error', message)
+
+    def __fail(self, row_report, status, message):
+        row_report['status'] = status
+        row_report['error'] = message
+
+    def export_configs(self, model_type, data_format):
+        """Streams all the configs of a model type as NDJSON or CSV,
+        reading them from Datastore page by page.
+
+        Args:
+            model_type (str): The model type (CoopCampaingConfig or RetailerConfig).
+            data_format (str): ndjson or csv.
+
+        Yields:
+            chunk (str): One exported line.
+        """
+
+        entities = self.ds_client.iter_all(model_type)
+        if data_format == 'csv':
+            fields = list(MODELS[model_type].__fields__)
+            buffer = io.StringIO()
+            writer = csv.DictWriter(buffer, fieldnames=fields, extrasaction='ignore')
+            writer.writeheader()
+            for entity in entities:
+                writer.writerow({field: self.__format_csv_value(entity.get(field)) for field in fields})
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate(0)
+            yield buffer.getvalue()
+        else:
+            for entity in entities:
+                yield json.dumps(entity, cls=utils.CustomJSONEncoder) + '\n'
+
+    def __format_csv_value(self, value):
+        if isinstance(value, (list, dict)):
+            return json.dumps(value, cls=utils.CustomJSONEncoder)
+        if value is None:
+            return ''
+        return value.isoformat() if hasattr(value, 'isoformat') else value
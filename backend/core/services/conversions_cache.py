@@ -0,0 +1,113 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import threading
+from collections import OrderedDict
+
+CACHE_MAX_BYTES = int(os.environ.get('CONVERSIONS_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+CACHE_MAX_ENTRY_BYTES = int(os.environ.get('CONVERSIONS_CACHE_MAX_ENTRY_BYTES', 16 * 1024 * 1024))
+
+class ConversionsSnapshotCache():
+    '''Process-local cache of the last conversions export of each Co-Op config,
+    stored with the ETag it was produced for and evicted least recently used
+    first when the cached exports exceed max_bytes.
+
+    Attributes:
+        max_bytes: Maximum size of all the cached exports.
+        max_entry_bytes: Exports larger than this are streamed but not cached.
+        stats: Hit, miss, store and eviction counters.
+    '''
+
+    def __init__(self, max_bytes=CACHE_MAX_BYTES, max_entry_bytes=CACHE_MAX_ENTRY_BYTES):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'stores': 0,
+            'evictions': 0
+        }
+        self.__lock = threading.Lock()
+
+    def get(self, name, etag):
+        '''Gets the cached export of a Co-Op config, None if it is missing
+        or was produced for another ETag.
+
+        Args:
+            name (str): The Co-Op config name.
+            etag (str): The ETag of the current export.
+        '''
+        with self.__lock:
+            entry = self.entries.get(name)
+            if not entry or entry[0] != etag:
+                self.stats['misses'] += 1
+                return None
+            self.entries.move_to_end(name)
+            self.stats['hits'] += 1
+            return entry[1]
+
+    def set(self, name, etag, content):
+        '''Caches the export of a Co-Op config, replacing the previous one.'''
+        if len(content) > self.max_entry_bytes:
+            return
+        with self.__lock:
+            previous = self.entries.pop(name, None)
+            if previous:
+                self.size -= len(previous[1])
+            self.entries[name] = (etag, content)
+            self.size += len(content)
+            self.stats['stores'] += 1
+            while self.size > self.max_bytes:
+                evicted_name, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted[1])
+                self.stats['evictions'] += 1
+
+    def tee(self, name, etag, chunks):
+        '''Passes the chunks of an export through and caches the export
+        once all of them were sent. Interrupted or oversized exports are
+        not cached.
+
+        Args:
+            name (str): The Co-Op config name.
+            etag (str): The ETag of the export.
+            chunks (iterator): The export chunks.
+
+        Yields:
+            chunk (str): Each chunk of the export.
+        '''
+        parts = []
+        size = 0
+        for chunk in chunks:
+            if parts is not None:
+                size += len(chunk)
+                if size <= self.max_entry_bytes:
+                    parts.append(chunk)
+                else:
+                    parts = None
+            yield chunk
+        if parts is not None:
+            self.set(name, etag, ''.join(parts))
+
+    def get_stats(self):
+        '''Returns a copy of the cache counters.'''
+        with self.__lock:
+            stats = dict(self.stats)
+            stats['entries'] = len(self.entries)
+            stats['bytes'] = self.size
+            return stats
+
+snapshot_cache = ConversionsSnapshotCache()
@@ -12,17 +12,32 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import itertools
+import os
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
 import utils
 from core.exceptions.coop_exception import CoopException
+from .backfill_service import BackfillService
 from .bigquery_service import BigqueryService
-from .datastore_service import DatastoreClient
+from .bulk_service import BulkService
+from .conversions_cache import snapshot_cache
+from .datastore_cache import CachedDatastoreClient
+from core.models.destinations import Dv360Destination, GoogleAdsApiDestination
+from .destinations.dispatcher import ConversionsDispatcher, DestinationRegistry
 from .destinations.google_ads_service import GoogleAdsService
+from .destinations.google_ads_api_service import GoogleAdsApiService
 from .destinations.dv360_cm_service import DV360CMService
 
 LOGGER_NAME = 'coop4all.coop_service'
 logger = utils.get_coop_logger(LOGGER_NAME)
+UPDATE_MAX_WORKERS = int(os.environ.get('UPDATE_MAX_WORKERS', 8))
+MAX_PAGE_SIZE = 1000
+PUSH_MAX_WORKERS = int(os.environ.get('DV360_PUSH_MAX_WORKERS', 4))
+# INFORMATION_SCHEMA.JOBS keeps the jobs of the last 180 days.
+BYTES_REPORT_MAX_DAYS = 180
 
 class CoopService():
     '''
@@ -32,11 +47,26 @@ class CoopService():
         Attributes:
             bq_client: A service to handle all the BigQuery operations.
             ds_client: A service to handle all the Datastore operations.
+            backfill_service: A service to backfill the retailer tables.
+            bulk_service: A service to import and export configs in bulk.
+            dv360_cm_service: A service to push the conversions to DV360/CM.
+            google_ads_api_service: A service to push the conversions with the Google Ads API.
+            destinations: The push destination services by destination type.
+            dispatcher: A service to push the conversions of a config to all its destinations.
     '''
 
     def __init__(self):
         self.bq_client = BigqueryService()
-        self.ds_client = DatastoreClient()
+        self.ds_client = CachedDatastoreClient()
+        self.backfill_service = BackfillService(self.bq_client, self.ds_client)
+        self.bulk_service = BulkService(self.bq_client, self.ds_client)
+        # Campaign Manager clients are created on the first push and reused by the next ones.
+        self.dv360_cm_service = DV360CMService(self.bq_client)
+        self.google_ads_api_service = GoogleAdsApiService(self.bq_client)
+        self.destinations = DestinationRegistry()
+        self.destinations.register(Dv360Destination, self.dv360_cm_service)
+        self.destinations.register(GoogleAdsApiDestination, self.google_ads_api_service)
+        self.dispatcher = ConversionsDispatcher(self.bq_client, self.destinations)
 
     def create_config(self, model):
         """Saves the model to Datastore and create the
@@ -60,9 +90,10 @@ class CoopService():
 
         model_params = model.dict(exclude_none=True)
         name = model_params['name']
+        bq_params = self.__build_bq_params(model_type, model_params)
         config = self.ds_client.add(model_type, model_params)
         if config:
-            self.bq_client.create(model_type, model_params)
+            self.bq_client.create(model_type, bq_params)
         else:
             logger.warning(f'CoopService - Empty config {model_type}-{name},' \
                 'BQ components were not created.')
@@ -82,14 +113,25 @@ class CoopService():
         model_type = model.__class__.__name__
         model_params = model.dict(exclude_none=True)
         name = model_params['name']
+        bq_params = self.__build_bq_params(model_type, model_params)
         config = self.ds_client.update(model_type, model_params)
         if config:
-            self.bq_client.update(model_type, model_params)
+            self.bq_client.update(model_type, bq_params)
         else:
             logger.warning(f'CoopService - Empty config {model_type}-{name},' \
                 'BQ components were not updated.')
         return config
 
+    def __build_bq_params(self, model_type, model_params):
+        '''Adds the coop_max_backfill of its retailer to the params of a coop
+        config, its table partitions expire after the same number of days.'''
+        if model_type == 'RetailerConfig':
+            return model_params
+        retailer_config = self.get_config('RetailerConfig', model_params['retailer_name'])
+        if not retailer_config:
+            raise CoopException(f'The retailer {model_params["retailer_name"]} was not found.', status_code=404)
+        return dict(model_params, coop_max_backfill=retailer_config.get('coop_max_backfill'))
+
     def delete_config(self, model_type, name):
         """Deletes the config from Datastore and
         datasets and tables from BgiQuery.
@@ -110,6 +152,7 @@ class CoopService():
                 self.ds_client.delete_multi(model_type='CoopCampaignConfig',
                                             name=name,
                                             field='retailer_name')
+                self.backfill_service.delete(name)
         else:
             logger.warning(f'CoopService - Empty config {model_type}-{name},' \
                 'BQ components were not deleted.')
@@ -141,6 +184,118 @@ class CoopService():
 
         return self.ds_client.get_all(model_type)
 
+    def list_configs(self, model_type, page_size=None, page_token=None,
+                     is_active=None, fields=None):
+        """Gets a page of entities for a model, optionally filtered by
+        is_active and projected to some fields.
+
+        Args:
+            model_type (str): The model type (CoopCampaingConfig or RetailerConfig).
+            page_size (int): Maximum number of entities, all of them if None.
+            page_token (str): Token returned by the previous page.
+            is_active (bool): Only returns entities with this is_active value.
+            fields (list): Fields to include in each entity, the name is always included.
+
+        Returns:
+            page (dict): The entities as items and the next_page_token.
+        """
+
+        if page_size is not None and not 1 <= page_size <= MAX_PAGE_SIZE:
+            raise CoopException(f'page_size must be between 1 and {MAX_PAGE_SIZE}.', status_code=422)
+        filters = {'is_active': is_active} if is_active is not None else None
+        entities, next_page_token = self.ds_client.get_page(
+            model_type, page_size=page_size, page_token=page_token, filters=filters)
+        if fields:
+            fields = set(fields) | {'name'}
+            entities = [{field: value for field, value in entity.items() if field in fields}
+                        for entity in entities]
+        return {
+            'items': entities,
+            'next_page_token': next_page_token
+        }
+
+    def import_configs(self, model_type, body, data_format):
+        """Creates configs in bulk from an NDJSON or CSV body.
+
+        Args:
+            model_type (str): The model type (CoopCampaingConfig or RetailerConfig).
+            body (str): The NDJSON or CSV configs.
+            data_format (str): ndjson or csv.
+
+        Returns:
+            report (list): The result of each row.
+        """
+
+        rows, parse_errors = self.bulk_service.parse_rows(body, data_format)
+        if not rows:
+            raise CoopException('There are no configs to import.', status_code=400)
+        return self.bulk_service.import_configs(model_type, rows, parse_errors)
+
+    def export_configs(self, model_type, data_format):
+        """Streams all the configs of a model type as NDJSON or CSV.
+
+        Args:
+            model_type (str): The model type (CoopCampaingConfig or RetailerConfig).
+            data_format (str): ndjson or csv.
+
+        Returns:
+            generator: The exported lines.
+        """
+
+        return self.bulk_service.export_configs(model_type, data_format)
+
+    def backfill_retailer(self, name, chunk_days=None, max_workers=None, restart=False):
+        """Starts the backfill of the retailer tables up to coop_max_backfill days
+        in the background, resuming the pending chunks of a previous backfill.
+        The coop tables of the retailer are rebuilt once it is done.
+
+        Args:
+            name (str): The retailer name.
+            chunk_days (int): Number of days per chunk for a new backfill.
+            max_workers (int): Maximum number of chunks running at the same time.
+            restart (bool): Discards the saved progress and plans a new backfill.
+
+        Returns:
+            backfill (dict): The backfill progress when it started.
+        """
+
+        retailer_config = self.get_config('RetailerConfig', name)
+        if not retailer_config:
+            raise CoopException('CoopService - backfill_retailer - ' \
+                'The retailer was not found.', status_code=404)
+        coop_configs = self.__group_active_coop_configs(self.ds_client.get_all('CoopCampaignConfig'))
+        return self.backfill_service.start(retailer_config, coop_configs.get(name, []), chunk_days=chunk_days,
+                                           max_workers=max_workers, restart=restart)
+
+    def resume_backfills(self):
+        """Restarts the retailer backfills that were interrupted while running,
+        e.g. when their instance was shut down.
+
+        Returns:
+            backfills (list): The progress of each resumed backfill.
+        """
+
+        backfills = []
+        for backfill in self.backfill_service.get_stale():
+            try:
+                backfills.append(self.backfill_retailer(backfill['name']))
+            except Exception as error:
+                logger.error(f'CoopService - Error resuming the backfill of retailer {backfill["name"]}: ' \
+                    f'{utils.build_error(error)["message"]}')
+        return backfills
+
+    def get_backfill_status(self, name):
+        """Gets the backfill progress of a retailer.
+
+        Args:
+            name (str): The retailer name.
+
+        Returns:
+            backfill (datastore.Entity): The backfill progress.
+        """
+
+        return self.backfill_service.get_status(name)
+
     def retailer_ready(self, retailer_config):
         """Checks if retailer tables are ready to be updated.
         A retailer is ready if there was not an update for the
@@ -162,9 +317,11 @@ class CoopService():
     def coop_campaign_ready(self, retailer_config, coop_config):
         """Checks if CoopCampaign table is ready to be updated.
         A CoopCampaing is ready if it was last modified before
-        the retailer tables.
+        the retailer tables. The tables metadata is read once per
+        retailer dataset and cached for the run.
 
         Args:
+            retailer_config (dict): Retailer parameters.
             coop_config (dict): CoopCampaign parameters.
 
         Returns:
@@ -172,14 +329,13 @@ class CoopService():
         """
 
         retailer_name = retailer_config.get('name')
-        clicks_table_reference = f'{retailer_name}.all_clicks'
-        clicks_table = self.bq_client.get_table(clicks_table_reference)
-        click_table_modified_at = clicks_table.modified
-        coop_table_reference = f'{retailer_name}.{coop_config["name"]}'
-        coop_table = self.bq_client.get_table(coop_table_reference)
-        coop_modified_at = coop_table.modified
-
-        return coop_modified_at < click_table_modified_at
+        tables_modified = self.bq_client.get_tables_last_modified(retailer_name)
+        click_table_modified_at = tables_modified.get('all_clicks')
+        coop_modified_at = tables_modified.get(coop_config['name'])
+        if not click_table_modified_at:
+            return False
+        # The coop table is built by the update if it does not exist yet.
+        return not coop_modified_at or coop_modified_at < click_table_modified_at
 
     def ga_table_ready(self, retailer_config):
         """Checks if the GA4 table from the day before is ready.
@@ -203,15 +359,94 @@ class CoopService():
                 f'{table_name} does not exists or it is not ready.')
         return table
 
-    def update_all(self):
+    def update_all(self, max_workers=None):
         """Checks each retailer and campaign and updates if needed.
+        Retailers are refreshed concurrently on a bounded worker pool,
+        each retailer updates its own coop configs after its tables.
+
+        Args:
+            max_workers (int): Maximum number of retailers refreshed at
+            the same time. Defaults to the UPDATE_MAX_WORKERS env variable.
+
+        Returns:
+            results (list): A summary dict per retailer.
         """
 
+        max_workers = max_workers or UPDATE_MAX_WORKERS
+        self.bq_client.clear_tables_metadata()
         retailer_configs = self.ds_client.get_all('RetailerConfig')
-        coop_configs = self.ds_client.get_all('CoopCampaignConfig')
-        logger.info('CoopService - Updating retailers if ready and not updated today...')
-        for retailer_config in retailer_configs:
-            retailer_name = retailer_config.get('name')
+        coop_configs_by_retailer = self.__group_active_coop_configs(
+            self.ds_client.get_all('CoopCampaignConfig'))
+        logger.info('CoopService - Updating retailers if ready and not updated today ' \
+            f'with {max_workers} workers...')
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(self.__update_retailer, retailer_config,
+                                       coop_configs_by_retailer.get(retailer_config.get('name'), []))
+                       for retailer_config in retailer_configs]
+            results = [future.result() for future in futures]
+        self.__save_retailers_updated_at(results)
+        return results
+
+    def __save_retailers_updated_at(self, results):
+        """Saves the bq_updated_at of all the updated retailers of a run
+        in batched Datastore writes.
+
+        Args:
+            results (list): The update summary per retailer.
+        """
+
+        updated = [result for result in results if result['status'] == 'updated']
+        if not updated:
+            return
+        updates = [{'name': result['retailer'], 'bq_updated_at': result['bq_updated_at']}
+                   for result in updated]
+        try:
+            self.ds_client.update_multi('RetailerConfig', updates)
+        except Exception as error:
+            message = utils.build_error(error)['message']
+            logger.error(f'CoopService - Error saving the retailers bq_updated_at: {message}')
+            for result in updated:
+                result['error'] = message
+
+    def __group_active_coop_configs(self, coop_configs):
+        """Groups the active coop configs by retailer in a single pass.
+
+        Args:
+            coop_configs (list): All the coop config entities.
+
+        Returns:
+            coop_configs_by_retailer (dict): Retailer name to its active coop configs.
+        """
+
+        coop_configs_by_retailer = defaultdict(list)
+        for coop_config in coop_configs:
+            if coop_config.get('is_active'):
+                coop_configs_by_retailer[coop_config['retailer_name']].append(coop_config)
+        return coop_configs_by_retailer
+
+    def __update_retailer(self, retailer_config, coop_configs):
+        """Updates the retailer tables if needed, otherwise the coop configs
+        of the retailer that are ready.
+
+        Args:
+            retailer_config (dict): Retailer parameters.
+            coop_configs (list): The active coop configs of the retailer.
+
+        Returns:
+            result (dict): The retailer update summary.
+        """
+
+        retailer_name = retailer_config.get('name')
+        result = {
+            'retailer': retailer_name,
+            'status': 'skipped',
+            'coop_configs_updated': [],
+            'coop_configs_skipped': [],
+            'coop_configs_failed': [],
+            'bq_updated_at': None,
+            'error': None
+        }
+        try:
             bq_ga_table = retailer_config.get('bq_ga_table')
             if self.ga_table_ready(retailer_config):
                 pass
@@ -227,40 +462,64 @@ class CoopService():
                 logger.info(f'CoopService - GA table {bq_ga_table} ready,' \
                     f'retailer ready and not updated today. Updating retailer {retailer_name}...')
                 self.bq_client.update('RetailerConfig', retailer_config)
-                retailer_config['bq_updated_at'] = current_date
-                self.ds_client.update('RetailerConfig', retailer_config)
+                # bq_updated_at is saved for all the retailers at the end of the run.
+                result['bq_updated_at'] = current_date
+                result['status'] = 'updated'
                 logger.info(
                     f'CoopService - Updated retailer' \
                     f'{retailer_name} all_clicks and all_transactions tables.')
             else:
                 logger.info(f'CoopService - Updating coop configs under retailer {retailer_name}' \
                     'if ready and not updated today...')
+                ready_coop_configs = []
                 for coop_config in coop_configs:
                     coop_config_name = coop_config.get('name')
-                    coop_config_is_active = coop_config.get('is_active')
-                    if coop_config['retailer_name'] == retailer_name and coop_config_is_active:
-
-                        if self.coop_campaign_ready(retailer_config, coop_config):
-                            logger.info(f'CoopService - coop config ready and not updated today.' \
-                                f'Updating coop config {coop_config_name}...')
-                            self.bq_client.update('CoopCampaignConfig', coop_config)
-                            logger.info(
-                                f'CoopService - Updated coop config' \
-                                f'{coop_config_name} table.')
-                        else:
-                            logger.info(f'CoopService - Coop config {coop_config_name} was not updated since' \
-                                'it was not ready or it was already updated.')
-
-    def get_google_ads_conversions(self, name):
+                    if self.coop_campaign_ready(retailer_config, coop_config):
+                        # Existing tables are merged incrementally, config changes rebuild them in update_config.
+                        tables_modified = self.bq_client.get_tables_last_modified(retailer_name)
+                        coop_params = dict(coop_config)
+                        coop_params['incremental'] = coop_config_name in tables_modified
+                        ready_coop_configs.append(coop_params)
+                    else:
+                        result['coop_configs_skipped'].append(coop_config_name)
+                        logger.info(f'CoopService - Coop config {coop_config_name} was not updated since' \
+                            'it was not ready or it was already updated.')
+                if ready_coop_configs:
+                    coop_config_names = [coop_params['name'] for coop_params in ready_coop_configs]
+                    logger.info(f'CoopService - coop configs ready and not updated today.' \
+                        f'Updating coop configs {coop_config_names} in one batch...')
+                    failed_configs = self.bq_client.update_coop_batch(retailer_config, ready_coop_configs)
+                    result['coop_configs_updated'] = [name for name in coop_config_names if name not in failed_configs]
+                    result['coop_configs_failed'] = [{'coop_config': name, 'error': error}
+                                                     for name, error in failed_configs.items()]
+                    for name, error in failed_configs.items():
+                        logger.error(f'CoopService - Error updating coop config {name} of retailer ' \
+                            f'{retailer_name}: {error}')
+                    logger.info(
+                        f'CoopService - Updated coop configs' \
+                        f'{result["coop_configs_updated"]} tables.')
+        except Exception as error:
+            # A failing retailer must not stop the refresh of the others.
+            result['status'] = 'error'
+            result['error'] = utils.build_error(error)['message']
+            logger.error(f'CoopService - Error updating retailer {retailer_name}: {result["error"]}')
+        return result
+
+    def get_google_ads_conversions(self, name, if_none_match=None):
         '''
         Endpoint to retrieve the Google Ads conversions for the specified
-        Co-Op Configuration.
+        Co-Op Configuration. The export is cached per Co-Op config until its
+        ETag changes, a matching If-None-Match runs no query.
 
             Args:
             name (str): The Co-Op Configuration name.
+            if_none_match (container): The ETags the client already has.
 
             Returns:
-            conversions (str): a list of Google Ads conversions in csv format.
+            conversions (iterator): the Google Ads conversions in csv format,
+            streamed in chunks, None if the client export is not modified.
+            The query already ran when it is returned.
+            etag (str): The ETag of the export, None if it can not be cached.
         '''
 
         coop_config = self.get_config('CoopCampaignConfig', name)
@@ -280,37 +539,216 @@ class CoopService():
             coop_config_params['currency'] = retailer['currency']
             coop_config_params['time_zone'] = retailer['time_zone']
             google_ads_service = GoogleAdsService(self.bq_client)
-            conversions = google_ads_service.get_conversions(coop_config_params)
-            if not conversions:
-                raise CoopException(f'CoopService - get_google_ads_conversions - ' \
-                f'There was a problem getting the conversions for the Co-Op Config {coop_name}.',
-                status_code=500)
-            return conversions
+            etag = google_ads_service.get_etag(coop_config_params)
+            if etag and if_none_match and etag in if_none_match:
+                return None, etag
+            snapshot = snapshot_cache.get(coop_name, etag) if etag else None
+            if snapshot is not None:
+                return iter([snapshot]), etag
+            conversions = google_ads_service.iter_conversions(coop_config_params)
+            return self.__start_export(coop_name, etag, conversions, f'the Co-Op Config {coop_name}'), etag
         else:
             logger.info(
                 f'CoopService - get_google_ads_conversions - The Co-Op Config {coop_name} is inactive. ' \
                 'Conversions were not sent to Google Ads.')
+            return '', None
+
+    def get_google_ads_bulk_conversions(self, names=None, customer_id=None, sections=False,
+                                        if_none_match=None):
+        '''
+        Retrieves the Google Ads conversions of several Co-Op Configurations
+        with a single BigQuery query, either the listed configs or all the
+        configs with a Google Ads destination for a customer id. Inactive
+        configs and configs without a Co-Op table are left out.
+
+            Args:
+            names (list): The Co-Op Configuration names.
+            customer_id (str): The Google Ads customer id, used when no names are sent.
+            sections (bool): True for one csv section per Co-Op config, False
+            for a combined csv.
+            if_none_match (container): The ETags the client already has.
+
+            Returns:
+            conversions (iterator): the Google Ads conversions in csv format,
+            streamed in chunks, None if the client export is not modified,
+            empty if no config has conversions to export.
+            etag (str): The ETag of the export.
+        '''
+
+        if names:
+            coop_configs = []
+            for name in dict.fromkeys(names):
+                coop_config = self.get_config('CoopCampaignConfig', name)
+                if not coop_config:
+                    raise CoopException(f'CoopService - get_google_ads_bulk_conversions - '
+                    f'The Co-Op config {name} was not found. The conversions were not sent to Google Ads.',
+                    status_code=404)
+                coop_configs.append(coop_config)
+        elif customer_id:
+            coop_configs = [coop_config for coop_config in self.get_all('CoopCampaignConfig')
+                            if any(destination['type'] == 'google_ads' and destination['customer_id'] == customer_id
+                                   for destination in coop_config.get('destinations') or [])]
+        else:
+            raise CoopException('CoopService - get_google_ads_bulk_conversions - '
+            'The Co-Op config names or the Google Ads customer id are required.', status_code=400)
+        google_ads_service = GoogleAdsService(self.bq_client)
+        retailers = {}
+        coop_configs_params = []
+        etags = []
+        for coop_config in coop_configs:
+            coop_name = coop_config.get('name')
+            if not coop_config.get('is_active'):
+                logger.info(f'CoopService - get_google_ads_bulk_conversions - The Co-Op Config {coop_name} ' \
+                    'is inactive. Conversions were not sent to Google Ads.')
+                continue
+            retailer_name = coop_config['retailer_name']
+            if retailer_name not in retailers:
+                retailers[retailer_name] = self.get_config('RetailerConfig', retailer_name)
+            retailer = retailers[retailer_name]
+            if not retailer:
+                raise CoopException(f'CoopService - get_google_ads_bulk_conversions - The retailer ' \
+                f'{retailer_name} was not found. The conversions were not sent to Google Ads.',
+                status_code=404)
+            coop_config_params = dict(coop_config)
+            coop_config_params['currency'] = retailer['currency']
+            coop_config_params['time_zone'] = retailer['time_zone']
+            etag = google_ads_service.get_etag(coop_config_params)
+            if not etag:
+                # The union query would fail on a missing table.
+                logger.warning(f'CoopService - get_google_ads_bulk_conversions - The table of the Co-Op ' \
+                    f'Config {coop_name} was not found. Conversions were not sent to Google Ads.')
+                continue
+            coop_configs_params.append(coop_config_params)
+            etags.append(etag)
+        if not coop_configs_params:
+            return '', None
+        etag = google_ads_service.get_bulk_etag(coop_configs_params, etags, sections)
+        if if_none_match and etag in if_none_match:
+            return None, etag
+        coop_names = sorted(coop_config_params['name'] for coop_config_params in coop_configs_params)
+        cache_name = f'bulk:{",".join(coop_names)}:{"sections" if sections else "combined"}'
+        snapshot = snapshot_cache.get(cache_name, etag)
+        if snapshot is not None:
+            return iter([snapshot]), etag
+        conversions = google_ads_service.iter_bulk_conversions(coop_configs_params, sections)
+        return self.__start_export(cache_name, etag, conversions,
+                                   f'the Co-Op Configs {", ".join(coop_names)}'), etag
+
+    def __start_export(self, cache_name, etag, conversions, description):
+        '''Runs the query of a conversions export by reading its first chunk,
+        so its errors are raised before the response starts, and caches the
+        export once it is fully streamed.'''
+        try:
+            first_chunk = next(conversions)
+        except StopIteration:
+            # Nothing to export, not even a header.
             return ''
+        except Exception as error:
+            logger.error(f'CoopService - Error getting the Google Ads conversions ' \
+                f'for {description}: {utils.build_error(error)["message"]}')
+            raise CoopException(f'CoopService - ' \
+            f'There was a problem getting the conversions for {description}.',
+            status_code=500)
+        conversions = itertools.chain([first_chunk], conversions)
+        if etag:
+            conversions = snapshot_cache.tee(cache_name, etag, conversions)
+        return conversions
+
+    def push_conversions(self, destination_types=None, max_workers=None, force_resend=False):
+        """Pushes the conversions of all the active Co-Op Configurations to their
+        push destinations, several configs at the same time. The conversions
+        of each config are read once and uploaded to all its destinations
+        concurrently. A failing config or destination does not stop the others.
 
-    def push_dv360_cm_conversions(self):
-        '''Endpoint to push the DV360/CM conversions for all the Co-Op Configurations'''
+        Args:
+            destination_types (list): Only pushes to the destinations of these
+            types, all the registered ones by default.
+            max_workers (int): Maximum number of configs pushed at the same
+            time. Defaults to the DV360_PUSH_MAX_WORKERS env variable.
+            force_resend (bool): Also sends the DV360/CM conversions already uploaded.
 
-        dv360_cm_service = DV360CMService(self.bq_client)
+        Returns:
+            results (list): The upload outcome per Co-Op config and destination.
+        """
+
+        max_workers = max_workers or PUSH_MAX_WORKERS
         configs = self.get_all('CoopCampaignConfig')
+        retailers = {retailer['name']: retailer for retailer in self.get_all('RetailerConfig')}
+        push_configs = []
         for coop_config in configs:
             coop_config_name = coop_config.get('name')
             if coop_config.get('is_active'):
-                # Push conversions only if destination is available
-                if self.__is_destination_available(coop_config, 'dv360'):
-                    dv360_cm_service.upload_conversions(coop_config)
+                # Push conversions only if a push destination is available
+                if self.dispatcher.get_push_destinations(coop_config, destination_types):
+                    push_configs.append(coop_config)
                 else:
-                    logger.info(f'CoopService - push_dv360_cm_conversions - ' \
-                    f'No DV360 Destination available for Co-Op Config {coop_config_name}.')
+                    logger.info(f'CoopService - push_conversions - ' \
+                    f'No push Destination available for Co-Op Config {coop_config_name}.')
             else:
-                logger.info(f'CoopService - push_dv360_cm_conversions -  The Co-Op ' \
-                f'Config {coop_config_name} is disabled. Conversions were not sent to DV360/CM.')
+                logger.info(f'CoopService - push_conversions -  The Co-Op ' \
+                f'Config {coop_config_name} is disabled. Conversions were not pushed.')
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(self.__push_config, coop_config,
+                                       retailers.get(coop_config.get('retailer_name')),
+                                       destination_types, force_resend)
+                       for coop_config in push_configs]
+            return [execution for future in futures for execution in future.result()]
+
+    def __push_config(self, coop_config, retailer, destination_types, force_resend):
+        coop_config_name = coop_config.get('name')
+        try:
+            if not retailer:
+                raise CoopException('CoopService - push_conversions - ' \
+                    'The retailer was not found. The conversions were not pushed.', status_code=404)
+            # The push query formats the conversions with the retailer time zone and currency.
+            coop_config_params = dict(coop_config)
+            coop_config_params['currency'] = retailer['currency']
+            coop_config_params['time_zone'] = retailer['time_zone']
+            return self.dispatcher.push_conversions(coop_config_params, destination_types=destination_types,
+                                                    force_resend=force_resend)
+        except Exception as error:
+            message = utils.build_error(error)['message']
+            logger.error(f'CoopService - push_conversions - Error pushing the ' \
+                f'conversions of Co-Op Config {coop_config_name}: {message}')
+            return [{
+                'coop_config': coop_config_name,
+                'status': 'error',
+                'error': message
+            }]
+
+    def push_dv360_cm_conversions(self, max_workers=None, force_resend=False):
+        """Pushes the DV360/CM conversions of all the active Co-Op Configurations
+        with a DV360 destination. Only the conversions that are not in the
+        uploads ledger of each config are sent, unless force_resend is set.
+
+        Returns:
+            results (list): The upload outcome per Co-Op config.
+        """
+
+        return self.push_conversions(destination_types=['dv360'], max_workers=max_workers,
+                                     force_resend=force_resend)
+
+    def push_google_ads_conversions(self, max_workers=None):
+        """Pushes the click conversions of all the active Co-Op Configurations
+        with a Google Ads API destination.
+
+        Returns:
+            results (list): The upload outcome per Co-Op config.
+        """
+
+        return self.push_conversions(destination_types=['google_ads_api'], max_workers=max_workers)
+
+    def get_jobs_bytes_report(self, days=14):
+        """Gets the daily bytes scanned by the Co-Op jobs per job type and retailer.
+
+        Args:
+            days (int): Number of days to include in the report, up to 180.
+
+        Returns:
+            report (list): The bytes scanned per day, job type and retailer.
+        """
 
-    def __is_destination_available(self, coop_config, destination_type):
-        params = [destination for destination in coop_config["destinations"]
-                        if destination["type"] == destination_type]
-        return len(params) > 0
\ No newline at end of file
+        if days < 1 or days > BYTES_REPORT_MAX_DAYS:
+            raise CoopException(f'days must be an integer between 1 and {BYTES_REPORT_MAX_DAYS}.',
+                                status_code=400)
+        return self.bq_client.get_jobs_bytes_report(days)
@@ -0,0 +1,207 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import copy
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from google.cloud import datastore
+from .datastore_service import DatastoreClient
+
+CACHE_TTL_SECONDS = int(os.environ.get('DS_CACHE_TTL_SECONDS', 300))
+CACHE_MAX_ENTRIES = int(os.environ.get('DS_CACHE_MAX_ENTRIES', 1000))
+VERSION_CHECK_SECONDS = int(os.environ.get('DS_CACHE_VERSION_CHECK_SECONDS', 30))
+CACHED_MODEL_TYPES = ('RetailerConfig', 'CoopCampaignConfig')
+# Datastore kind holding one version entity per cached model type, changed on every write.
+VERSION_MODEL_TYPE = 'CacheVersion'
+
+class DatastoreCache():
+    '''Process-local cache of Datastore entities with TTL and size-bounded
+    (least recently used) eviction.
+
+    Attributes:
+        ttl: Seconds an entry is served before it is read again.
+        max_entries: Maximum number of entries, the least recently used is evicted.
+        stats: Hit, miss, eviction and invalidation counters.
+    '''
+
+    def __init__(self, ttl=CACHE_TTL_SECONDS, max_entries=CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.generations = {}
+        self.versions = {}
+        self.versions_checked_at = 0
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'invalidations': 0
+        }
+        self.__lock = threading.Lock()
+
+    def generation(self, model_type):
+        '''Returns the current generation of a model type, it changes on
+        every invalidation so stale reads are not stored.'''
+        with self.__lock:
+            return self.generations.get(model_type, 0)
+
+    def get(self, key):
+        '''Gets a cached value, None if missing or expired.
+
+        Args:
+            key (tuple): The model type and the entity name (None for all).
+        '''
+        with self.__lock:
+            entry = self.entries.get(key)
+            if not entry or entry[0] < time.monotonic():
+                self.stats['misses'] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return entry[1]
+
+    def set(self, key, value, generation):
+        '''Caches a value read at the given generation of its model type.'''
+        with self.__lock:
+            if self.generations.get(key[0], 0) != generation:
+                return
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.stats['evictions'] += 1
+
+    def invalidate(self, model_type):
+        '''Removes all the entries of a model type.'''
+        with self.__lock:
+            self.generations[model_type] = self.generations.get(model_type, 0) + 1
+            for key in [key for key in self.entries if key[0] == model_type]:
+                del self.entries[key]
+            self.stats['invalidations'] += 1
+
+    def versions_check_due(self):
+        with self.__lock:
+            return time.monotonic() - self.versions_checked_at >= VERSION_CHECK_SECONDS
+
+    def sync_versions(self, versions):
+        '''Invalidates the model types whose Datastore version changed
+        since the last check, e.g. after a write in another instance.
+
+        Args:
+            versions (dict): Model type to its current Datastore version.
+        '''
+        with self.__lock:
+            changed = [model_type for model_type, version in versions.items()
+                       if self.versions.get(model_type, version) != version]
+            self.versions.update(versions)
+            self.versions_checked_at = time.monotonic()
+        for model_type in changed:
+            self.invalidate(model_type)
+
+    def get_stats(self):
+        '''Returns a copy of the cache counters.'''
+        with self.__lock:
+            stats = dict(self.stats)
+            stats['entries'] = len(self.entries)
+            return stats
+
+cache = DatastoreCache()
+
+class CachedDatastoreClient(DatastoreClient):
+    '''DatastoreClient that serves RetailerConfig and CoopCampaignConfig reads
+    from a process-local cache. Writes invalidate the cache immediately and
+    change the model type version in Datastore, other instances check the
+    versions every VERSION_CHECK_SECONDS.
+    '''
+
+    def __check_versions(self):
+        if not cache.versions_check_due():
+            return
+        keys = [self.client.key(VERSION_MODEL_TYPE, model_type) for model_type in CACHED_MODEL_TYPES]
+        entities = self.client.get_multi(keys)
+        versions = {model_type: None for model_type in CACHED_MODEL_TYPES}
+        versions.update({entity.key.name: entity.get('version') for entity in entities})
+        cache.sync_versions(versions)
+
+    def __changed(self, model_type):
+        '''Invalidates the local cache and changes the Datastore version of
+        the model type after a write.'''
+        if model_type not in CACHED_MODEL_TYPES:
+            return
+        cache.invalidate(model_type)
+        entity = datastore.Entity(self.client.key(VERSION_MODEL_TYPE, model_type))
+        entity.update({'version': uuid.uuid4().hex})
+        self.client.put(entity)
+
+    def __cached(self, model_type, name, read):
+        if model_type not in CACHED_MODEL_TYPES:
+            return read()
+        self.__check_versions()
+        key = (model_type, name)
+        value = cache.get(key)
+        if value is None:
+            generation = cache.generation(model_type)
+            value = read()
+            if value is not None:
+                cache.set(key, value, generation)
+        # Callers update the returned entities, the cached ones are never shared.
+        return copy.deepcopy(value)
+
+    def get_all(self, model_type):
+        return self.__cached(model_type, None, lambda: super(CachedDatastoreClient, self).get_all(model_type))
+
+    def get_by_name(self, model_type, name):
+        return self.__cached(model_type, name,
+                             lambda: super(CachedDatastoreClient, self).get_by_name(model_type, name))
+
+    def delete(self, model_type, name):
+        entity = super().delete(model_type, name)
+        self.__changed(model_type)
+        return entity
+
+    def delete_multi(self, model_type, name, field):
+        super().delete_multi(model_type, name, field)
+        self.__changed(model_type)
+
+    def add(self, model_type, model_params):
+        entity = super().add(model_type, model_params)
+        self.__changed(model_type)
+        return entity
+
+    def add_multi(self, model_type, models_params):
+        entities = super().add_multi(model_type, models_params)
+        self.__changed(model_type)
+        return entities
+
+    def update(self, model_type, model_params):
+        entity = super().update(model_type, model_params)
+        self.__changed(model_type)
+        return entity
+
+    def update_multi(self, model_type, updates):
+        entities = super().update_multi(model_type, updates)
+        self.__changed(model_type)
+        return entities
+
+    def put(self, model_type, model_params):
+        entity = super().put(model_type, model_params)
+        self.__changed(model_type)
+        return entity
+
+    def get_stats(self):
+        '''Returns the hit/miss counters of the cache.'''
+        return cache.get_stats()
@@ -13,7 +13,13 @@
 # limitations under the License.
 
 
+from google.api_core.exceptions import Aborted, BadRequest, Conflict
 from google.cloud import datastore
+from core.exceptions.coop_exception import CoopException
+
+# A Datastore commit accepts up to 500 entities.
+MAX_BATCH_SIZE = 500
+MAX_TRANSACTION_RETRIES = 3
 
 
 class DatastoreClient():
@@ -34,6 +40,61 @@ class DatastoreClient():
         entities = list(query.fetch())
         return entities
 
+    def iter_all(self, model_type):
+        """Iterates all entities for a specific model_type, reading
+        them page by page.
+
+        Args:
+            model_type (str): The model type (CoopCampaingConfig or RetailerConfig).
+
+        Yields:
+            entity (datastore.Entity)
+        """
+
+        query = self.client.query(kind=model_type)
+        for entity in query.fetch():
+            yield entity
+
+    def get_page(self, model_type, page_size=None, page_token=None, filters=None):
+        """Get a page of entities for a specific model_type using
+        Datastore query cursors.
+
+        Args:
+            model_type (str): The model type (CoopCampaingConfig or RetailerConfig).
+            page_size (int): Maximum number of entities, all of them if None.
+            page_token (str): Cursor returned by the previous page.
+            filters (dict): Field name to the value it must be equal to.
+
+        Returns:
+            entities (lst): A list of entities.
+            next_page_token (str): Cursor of the next page, None if
+            this is the last page.
+
+        Raises:
+            CoopException: 400 if the page_token is not a valid cursor.
+        """
+
+        query = self.client.query(kind=model_type)
+        for field, value in (filters or {}).items():
+            query.add_filter(field, '=', value)
+        # Reads as many server batches as needed, a batch can hold less than page_size entities.
+        iterator = query.fetch(limit=page_size, start_cursor=page_token)
+        try:
+            entities = list(iterator)
+        except (ValueError, BadRequest) as error:
+            # The cursor is decoded on the first read, a malformed one is a client error.
+            if page_token is None:
+                raise
+            raise CoopException(f'The page_token is not valid: {error}', status_code=400)
+        next_page_token = iterator.next_page_token
+        if not page_size or len(entities) < page_size or not next_page_token:
+            return entities, None
+        # The page ended at the limit, the cursor is only returned if some entity is left after it.
+        query.keys_only()
+        if next(iter(query.fetch(limit=1, start_cursor=next_page_token)), None) is None:
+            return entities, None
+        return entities, next_page_token.decode('utf-8')
+
     def get_by_name(self, model_type, name):
         """Get a Datastore entity by name.
 
@@ -51,6 +112,24 @@ class DatastoreClient():
         if entity:
             return entity
 
+    def get_multi_by_name(self, model_type, names):
+        """Get multiple Datastore entities by name in a single lookup.
+
+        Args:
+            model_type (str): The model type (CoopCampaingConfig or RetailerConfig).
+            names (list): The names (keys) of the entities.
+
+        Returns:
+            entities (dict): Name to entity, entities not found are missing.
+        """
+
+        keys = [self.client.key(model_type, name) for name in set(names)]
+        entities = {}
+        for i in range(0, len(keys), MAX_BATCH_SIZE):
+            entities.update({entity.key.name: entity
+                             for entity in self.client.get_multi(keys[i:i + MAX_BATCH_SIZE])})
+        return entities
+
     def delete(self, model_type, name):
         """Delete an entity in datastore.
 
@@ -109,6 +188,35 @@ class DatastoreClient():
                 t.put(entity)
                 return entity
 
+    def add_multi(self, model_type, models_params):
+        """Saves multiple new models to Datastore with put_multi, in
+        transactions of up to 500 entities. Existing entities are not
+        replaced.
+
+        Args:
+            model_type (str): The model type (CoopCampaingConfig or RetailerConfig).
+            models_params (list): Model parameters of each entity to save.
+
+        Returns:
+            entities (list): The new entities created.
+        """
+
+        created = []
+        for i in range(0, len(models_params), MAX_BATCH_SIZE):
+            batch = models_params[i:i + MAX_BATCH_SIZE]
+            with self.client.transaction():
+                keys = [self.client.key(model_type, model_params['name']) for model_params in batch]
+                existing = {entity.key.name for entity in self.client.get_multi(keys)}
+                entities = []
+                for key, model_params in zip(keys, batch):
+                    if model_params['name'] not in existing:
+                        entity = datastore.Entity(key)
+                        entity.update(model_params)
+                        entities.append(entity)
+                self.client.put_multi(entities)
+            created.extend(entities)
+        return created
+
     def update(self, model_type, model_params):
         """Updates the model in Datastore.
 
@@ -129,3 +237,53 @@ class DatastoreClient():
                 entity.update(model_params)
                 t.put(entity)
                 return entity
+
+    def put(self, model_type, model_params):
+        """Creates or replaces the model in Datastore.
+
+        Args:
+            model_type (str): The model type (e.g. RetailerBackfill).
+            model_params (dict): Model parameters to save in datastore.
+
+        Returns:
+            entity (datastore.Entity): The saved entity.
+        """
+
+        key = self.client.key(model_type, model_params['name'])
+        entity = datastore.Entity(key)
+        entity.update(model_params)
+        self.client.put(entity)
+        return entity
+
+    def update_multi(self, model_type, updates):
+        """Updates some fields of multiple entities with put_multi, in as
+        few transactions as possible. Entities are read again inside the
+        transaction and only the given fields are replaced, a transaction
+        that conflicts with a concurrent write is retried.
+
+        Args:
+            model_type (str): The model type (CoopCampaingConfig or RetailerConfig).
+            updates (list): Dicts with the entity name and the fields to update.
+
+        Returns:
+            entities (list): The updated entities, entities that were not
+            found are skipped.
+        """
+
+        updated = []
+        for i in range(0, len(updates), MAX_BATCH_SIZE):
+            batch = {update['name']: update for update in updates[i:i + MAX_BATCH_SIZE]}
+            for attempt in range(MAX_TRANSACTION_RETRIES):
+                try:
+                    with self.client.transaction():
+                        keys = [self.client.key(model_type, name) for name in batch]
+                        entities = self.client.get_multi(keys)
+                        for entity in entities:
+                            entity.update(batch[entity.key.name])
+                        self.client.put_multi(entities)
+                    break
+                except (Aborted, Conflict):
+                    if attempt == MAX_TRANSACTION_RETRIES - 1:
+                        raise
+            updated.extend(entities)
+        return updated
@@ -0,0 +1,116 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import queue
+import threading
+from contextlib import contextmanager
+import google.auth
+import google_auth_httplib2
+import httplib2
+import utils
+from googleapiclient import discovery, discovery_cache
+
+LOGGER_NAME = 'coop4all.cm_client_factory'
+logger = utils.get_coop_logger(LOGGER_NAME)
+API_NAME = 'dfareporting'
+API_VERSION = 'v4'
+API_SCOPES = ['https://www.googleapis.com/auth/dfareporting',
+            'https://www.googleapis.com/auth/dfatrafficking',
+            'https://www.googleapis.com/auth/ddmconversions']
+# Idle clients kept for reuse, each one holds its own pooled HTTP connections.
+MAX_IDLE_CLIENTS = int(os.environ.get('CM_MAX_IDLE_CLIENTS', 8))
+HTTP_TIMEOUT_SECONDS = int(os.environ.get('CM_HTTP_TIMEOUT_SECONDS', 60))
+
+class CampaignManagerClientFactory():
+    '''Long-lived, thread-safe factory of Campaign Manager API clients.
+
+    The credentials are loaded and the discovery document is parsed once per
+    process, from the document bundled with google-api-python-client (it is
+    fetched once only if the library does not bundle it). httplib2 transports
+    are not thread-safe, so each client is lent to one thread at a time and
+    returned to an idle pool, keeping its authorized transport and its open
+    connections for the next requests.
+
+    Attributes:
+        max_idle: Maximum number of idle clients kept for reuse.
+        stats: Counters of the clients built and reused.
+    '''
+
+    def __init__(self, max_idle=MAX_IDLE_CLIENTS):
+        self.max_idle = max_idle
+        self.credentials = None
+        self.document = None
+        self.stats = {
+            'built': 0,
+            'reused': 0
+        }
+        self.__idle = queue.LifoQueue()
+        self.__lock = threading.Lock()
+
+    def __load(self):
+        '''Loads the credentials and the discovery document on first use.'''
+        with self.__lock:
+            if self.document is not None:
+                return
+            self.credentials, project = google.auth.default(scopes=API_SCOPES)
+            document = discovery_cache.get_static_doc(API_NAME, API_VERSION)
+            if document is None:
+                logger.info(f'CampaignManagerClientFactory - No bundled discovery document for ' \
+                    f'{API_NAME} {API_VERSION}, fetching it once.')
+                service = discovery.build(API_NAME, API_VERSION, credentials=self.credentials,
+                                          static_discovery=False)
+                document = service._rootDesc
+                service.close()
+            self.document = json.loads(document) if isinstance(document, str) else document
+
+    def __build(self):
+        self.__load()
+        http = google_auth_httplib2.AuthorizedHttp(
+            self.credentials, http=httplib2.Http(timeout=HTTP_TIMEOUT_SECONDS))
+        with self.__lock:
+            self.stats['built'] += 1
+        return discovery.build_from_document(self.document, http=http)
+
+    @contextmanager
+    def client(self):
+        '''Lends a Campaign Manager client to the calling thread.
+
+        Yields:
+            service (googleapiclient.discovery.Resource): A client to use
+            only inside the with block.
+        '''
+        try:
+            service = self.__idle.get_nowait()
+            with self.__lock:
+                self.stats['reused'] += 1
+        except queue.Empty:
+            service = self.__build()
+        try:
+            yield service
+        finally:
+            if self.__idle.qsize() < self.max_idle:
+                self.__idle.put(service)
+            else:
+                service.close()
+
+    def get_stats(self):
+        '''Returns a copy of the client counters.'''
+        with self.__lock:
+            stats = dict(self.stats)
+        stats['idle'] = self.__idle.qsize()
+        return stats
+
+cm_client_factory = CampaignManagerClientFactory()
@@ -0,0 +1,149 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import utils
+from core.exceptions.coop_exception import CoopException
+from core.models.destinations import get_destination_type
+from .upload_pipeline import PIPELINE_QUEUE_SIZE, fan_out
+
+LOGGER_NAME = 'coop4all.destinations_dispatcher'
+logger = utils.get_coop_logger(LOGGER_NAME)
+PUSH_CONVERSIONS_SQL = 'sql/get_push_conversions.sql'
+# Retailer params the push query formats the conversions of every destination with.
+RETAILER_PARAMS = ('time_zone', 'currency')
+
+class DestinationRegistry():
+    '''Registry of the push destination services, keyed by the type
+    discriminator of their destination model.
+
+    A destination service implements:
+        batch_size: Number of conversions per upload request.
+        prepare(model_config, destination): Runs before the push query.
+        upload_conversions(model_config, destination, record_batches): Selects
+        its rows of the push query batches, uploads them with its own worker
+        pool and limits and returns the execution summary.
+
+    Attributes:
+        services: The destination services by destination type.
+    '''
+
+    def __init__(self):
+        self.services = {}
+
+    def register(self, destination_model, service):
+        '''Registers the service that pushes the conversions of a destination model.
+
+        Args:
+            destination_model (type): The destination model, e.g. Dv360Destination.
+            service: The destination service.
+        '''
+        self.services[get_destination_type(destination_model)] = service
+
+    def get(self, destination_type):
+        '''Gets the service of a destination type, None if it is not a push destination.'''
+        return self.services.get(destination_type)
+
+    def types(self):
+        '''Returns the registered destination types.'''
+        return list(self.services)
+
+class ConversionsDispatcher():
+    '''Pushes the conversions of a Co-Op config to all its push destinations.
+    The push query runs once per config and its record batches are fanned
+    out to the destinations, which upload them at the same time.
+
+    Attributes:
+        bq_service: Service that handles all the BigQuery operations
+        registry: The destination services by destination type
+    '''
+
+    def __init__(self, bq_service, registry):
+        self.bq_service = bq_service
+        self.registry = registry
+
+    def get_push_destinations(self, model_config, destination_types=None):
+        '''Gets the destinations of a Co-Op config handled by a registered service.
+
+        Args:
+            model_config (dict): The Co-Op config parameters.
+            destination_types (list): Only the destinations of these types, all by default.
+
+        Returns:
+            destinations (list): The push destinations of the config.
+        '''
+        return [destination for destination in model_config.get('destinations') or []
+                if self.registry.get(destination['type'])
+                and (destination_types is None or destination['type'] in destination_types)]
+
+    def __execution_error(self, model_config, destination, error):
+        message = utils.build_error(error)['message']
+        logger.error(f'ConversionsDispatcher - push_conversions - Error pushing the conversions of ' \
+            f'Co-Op Config {model_config.get("name")} to {destination["type"]}: {message}')
+        return {
+            'coop_config': model_config.get('name'),
+            'destination': destination['type'],
+            'status': 'error',
+            'error': message
+        }
+
+    def __consumer(self, model_config, destination):
+        '''Returns the fan-out consumer that uploads the conversions of a destination.'''
+        service = self.registry.get(destination['type'])
+        def upload(record_batches):
+            try:
+                execution = service.upload_conversions(model_config, destination, record_batches)
+                return dict(execution, destination=destination['type'])
+            except Exception as error:
+                return self.__execution_error(model_config, destination, error)
+        return upload
+
+    def push_conversions(self, model_config, destination_types=None, force_resend=False):
+        '''Pushes the conversions of a Co-Op config to its push destinations.
+        A failing destination does not stop the others.
+
+        Args:
+            model_config (dict): The Co-Op config parameters, with the time_zone
+            and currency of its retailer.
+            destination_types (list): Only pushes to the destinations of these
+            types, all by default.
+            force_resend (bool): Also sends the DV360/CM conversions already uploaded.
+
+        Returns:
+            executions (list): The execution summary of each destination.
+
+        Raises:
+            CoopException: If the retailer time_zone or currency is missing.
+        '''
+        missing_params = [param for param in RETAILER_PARAMS if not model_config.get(param)]
+        if missing_params:
+            raise CoopException(f'ConversionsDispatcher - push_conversions - The Co-Op Config ' \
+                f'{model_config.get("name")} params lack the retailer {", ".join(missing_params)}.')
+        executions = []
+        destinations = []
+        for destination in self.get_push_destinations(model_config, destination_types):
+            try:
+                self.registry.get(destination['type']).prepare(model_config, destination)
+                destinations.append(destination)
+            except Exception as error:
+                executions.append(self.__execution_error(model_config, destination, error))
+        if not destinations:
+            return executions
+        query_params = dict(model_config, force_resend=force_resend,
+                            destination_types=[destination['type'] for destination in destinations])
+        batch_size = max(self.registry.get(destination['type']).batch_size for destination in destinations)
+        consumers = [self.__consumer(model_config, destination) for destination in destinations]
+        # The query runs on the first read, its errors reach every destination through the fan-out.
+        record_batches = self.bq_service.iter_table_batches(
+            PUSH_CONVERSIONS_SQL, query_params, batch_size=batch_size, max_queue_size=PIPELINE_QUEUE_SIZE)
+        return executions + fan_out(record_batches, consumers)
@@ -0,0 +1,86 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pyarrow as pa
+
+CONVERSION_KIND = 'dfareporting#conversion'
+
+def column_values(record_batch, name):
+    '''Converts an Arrow column to a list of Python values. Columns without
+    nulls go through NumPy, which is several times faster than to_pylist.
+
+        Args:
+          record_batch (pyarrow.RecordBatch): The batch holding the column.
+          name (str): The column name.
+
+        Returns:
+          values (list): The column values, None for the nulls.
+    '''
+    column = record_batch.column(name)
+    if column.null_count:
+        return column.to_pylist()
+    return column.to_numpy(zero_copy_only=False).tolist()
+
+def build_conversions(record_batch, floodlight_activity_id, floodlight_configuration_id):
+    ''' Builds the Campaign Manager offline conversions of a batch of rows
+        from get_push_conversions.sql, column by column.
+
+        conversion_timestamp is the GA4 event_timestamp, already in microseconds,
+        so it is sent as is as an exact integer.
+
+        Args:
+          record_batch (pyarrow.RecordBatch): The conversions from the retailer's
+          Google Analytics account.
+          floodlight_activity_id (int): The Floodlight Activity where the offline conversion
+          will be sent to.
+          floodlight_configuration_id (int): The Floodlight Configuration where the offline
+          conversion will be sent to.
+
+        Returns:
+          conversions_upload (list): A list of conversions in the correct format to
+          send in the offline conversions request.
+    '''
+    timestamps = column_values(record_batch, 'conversion_timestamp')
+    dclids = column_values(record_batch, 'dclid')
+    quantities = column_values(record_batch, 'conversion_quantity')
+    values = column_values(record_batch, 'conversion_value')
+    return [{
+        'kind': CONVERSION_KIND,
+        'floodlightActivityId': floodlight_activity_id,
+        'floodlightConfigurationId': floodlight_configuration_id,
+        'ordinal': 1,
+        'timestampMicros': timestamp,
+        'dclid': dclid,
+        'quantity': quantity,
+        'value': value
+    } for timestamp, dclid, quantity, value in zip(timestamps, dclids, quantities, values)]
+
+def build_uploaded_keys(record_batch, uploaded):
+    ''' Builds the uploads ledger rows of the conversions of a batch that
+        were uploaded, keyed by dclid, timestamp and event name.
+
+        Args:
+          record_batch (pyarrow.RecordBatch): The conversions of the batch.
+          uploaded (list): A bool per conversion, True if it was uploaded.
+
+        Returns:
+          keys (pyarrow.Table): The dclid, conversion_timestamp and event_name
+          of the uploaded conversions.
+    '''
+    keys = pa.Table.from_arrays([
+        record_batch.column('dclid'),
+        record_batch.column('conversion_timestamp'),
+        record_batch.column('event_name')
+    ], names=['dclid', 'conversion_timestamp', 'event_name'])
+    return keys.filter(pa.array(uploaded, type=pa.bool_()))
@@ -12,15 +12,31 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
+import socket
+from datetime import datetime, timezone
+import pyarrow as pa
+import pyarrow.compute as pc
 import utils
-from googleapiclient import discovery
-import google.auth
+from googleapiclient.errors import HttpError
+from ..bigquery_service import UPLOADS_LEDGER_SUFFIX
+from .cm_client_factory import cm_client_factory
+from .dv360_cm_conversions import build_conversions, build_uploaded_keys
+from .rate_limiter import get_token_bucket
+from .upload_pipeline import execute_with_retries, new_outcome, rebatch, run_upload_pipeline, \
+    summarize_outcomes
 
 LOGGER_NAME = 'coop4all.dv360_cm_service'
 logger = utils.get_coop_logger(LOGGER_NAME)
-API_SCOPES = ['https://www.googleapis.com/auth/dfareporting',
-            'https://www.googleapis.com/auth/dfatrafficking',
-            'https://www.googleapis.com/auth/ddmconversions']
+# Campaign Manager accepts up to 1000 conversions per batchinsert request.
+CONVERSIONS_BATCH_SIZE = 1000
+UPLOAD_MAX_WORKERS = int(os.environ.get('DV360_UPLOAD_MAX_WORKERS', 4))
+# Requests per second (and burst) allowed per CM profile, shared by all the uploads of the process.
+CM_REQUESTS_PER_SECOND = float(os.environ.get('DV360_CM_REQUESTS_PER_SECOND', 5))
+MAX_RETRIES = int(os.environ.get('DV360_MAX_RETRIES', 5))
+BACKOFF_SECONDS = float(os.environ.get('DV360_BACKOFF_SECONDS', 1))
+BACKOFF_MAX_SECONDS = float(os.environ.get('DV360_BACKOFF_MAX_SECONDS', 32))
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
 
 class DV360CMService():
     '''DV360/CM service that retrieves conversions for a specific
@@ -28,94 +44,141 @@ class DV360CMService():
 
     Attributes:
         bq_service: Service that handles all the BigQuery operations
-        service: The Campaign Manager service to access the API
+        client_factory: Factory that lends the Campaign Manager clients to access the API
+        batch_size: Number of conversions per batchinsert request
     '''
 
-    def __init__(self, bq_service):
+    def __init__(self, bq_service, client_factory=None):
         self.bq_service = bq_service
-        credentials, project = google.auth.default(scopes=API_SCOPES)
-        self.__build_dv360_cm_service(credentials)
+        self.client_factory = client_factory or cm_client_factory
+        self.batch_size = CONVERSIONS_BATCH_SIZE
 
-    def __build_dv360_cm_service(self, credentials):
-        '''Creates the DV60/CM service'''
-        self.service = discovery.build('dfareporting', 'v4', credentials=credentials)
+    def __is_retryable(self, error):
+        if isinstance(error, HttpError):
+            status = error.resp.status
+            # CM reports the exhausted rate limits as 403 rateLimitExceeded/userRateLimitExceeded.
+            return status in RETRYABLE_STATUSES or \
+                (status == 403 and b'ratelimitexceeded' in (error.content or b'').lower())
+        return isinstance(error, (ConnectionError, TimeoutError, socket.timeout))
 
-    def __build_conversions(self, conversions, floodlight_activity_id, floodlight_configuration_id):
-        ''' Builds a list of offline conversions in the correct format for the request.
+    def __execute(self, cm_profile_id, request_body, outcome, log_message):
+        '''Executes a batchinsert request within the CM profile rate limit,
+        retrying the retryable errors with jittered exponential backoff.'''
+        def execute():
+            with self.client_factory.client() as service:
+                request = service.conversions().batchinsert(
+                    profileId=cm_profile_id, body=request_body)
+                return request.execute()
+        bucket = get_token_bucket(f'cm_profile:{cm_profile_id}', CM_REQUESTS_PER_SECOND)
+        return execute_with_retries(execute, self.__is_retryable, bucket, MAX_RETRIES, outcome,
+                                    log_message, BACKOFF_SECONDS, BACKOFF_MAX_SECONDS)
 
-            Args:
-              conversions (list): A list of offline conversions from the retailer's Google
-              Analytics account.
-              floodlight_activity_id (int): The Floodlight Activity where the offline conversion
-              will be sent to.
-              floodlight_configuration_id (int): The Floodlight Configuration where the offline
-              conversion will be sent to.
+    def __upload_batch(self, cm_profile_id, log_message, index, record_batch, conversions):
+        '''Uploads a batch of conversions, errors are reported in the
+        batch outcome instead of being raised.
 
             Returns:
-              conversions_upload (list): A list of conversions in the correct format to
-              send in the offline conversions request.
+              outcome (dict): The batch index, status (uploaded, partial or failed),
+              number of conversions and failed conversions, attempts and errors.
+              uploaded_keys (pyarrow.Table): The ledger rows of the uploaded conversions.
         '''
-        conversions_upload = []
-        for index, conversion in conversions.iterrows():
-            conversion_obj = {
-                "kind": "dfareporting#conversion",
-                'floodlightActivityId': floodlight_activity_id,
-                'floodlightConfigurationId': floodlight_configuration_id,
-                'ordinal': 1,
-                'timestampMicros': conversion['Conversion_Timestamp'] * 10e5,
-                'dclid': conversion['Google_Click_ID'],
-                "quantity": conversion['Conversion_Quantity'],
-                "value": conversion['Conversion_Value']
-            }
-            conversions_upload.append(conversion_obj)
-        return conversions_upload
-
-    def upload_conversions(self, model_config):
-        '''Builds and executes offline conversion requests using the Campaign Manager API
+        outcome = new_outcome(index, len(conversions))
+        try:
+            response = self.__execute(cm_profile_id, {'conversions': conversions}, outcome, log_message)
+        except Exception as error:
+            outcome['status'] = 'failed'
+            outcome['failed_conversions'] = len(conversions)
+            outcome['errors'].append(utils.build_error(error)['message'])
+            return outcome, None
+        uploaded = [True] * len(conversions)
+        if response.get('hasFailures'):
+            statuses = response.get('status', [])
+            # The statuses follow the order of the conversions, without them nothing is recorded as uploaded.
+            uploaded = [not status.get('errors') for status in statuses] \
+                if len(statuses) == len(conversions) else [False] * len(conversions)
+            errors = set()
+            for status in statuses:
+                if status.get('errors'):
+                    errors.update(f'{error["code"]} - {error["message"]}' for error in status['errors'])
+            outcome['failed_conversions'] = uploaded.count(False)
+            outcome['errors'] = sorted(errors)
+            outcome['status'] = 'failed' if outcome['failed_conversions'] == len(conversions) else 'partial'
+        return outcome, build_uploaded_keys(record_batch, uploaded)
+
+    def __save_uploaded_keys(self, model_config, uploaded_keys):
+        '''Appends the keys of the uploaded conversions to the uploads ledger
+        of the Co-Op config with a single load job.'''
+        uploaded_keys = [keys for keys in uploaded_keys if keys is not None and keys.num_rows]
+        if not uploaded_keys:
+            return
+        keys = pa.concat_tables(uploaded_keys)
+        uploaded_at = pa.scalar(datetime.now(timezone.utc), type=pa.timestamp('us', tz='UTC'))
+        keys = keys.append_column('uploaded_at', pa.repeat(uploaded_at, keys.num_rows))
+        self.bq_service.append_rows(self.__ledger_table_id(model_config), keys)
+
+    def __ledger_table_id(self, model_config):
+        return f'{model_config.get("retailer_name")}.{model_config.get("name")}{UPLOADS_LEDGER_SUFFIX}'
+
+    def prepare(self, model_config, destination):
+        '''Creates the uploads ledger of the Co-Op config if it is missing,
+        the push query reads it to flag the conversions already uploaded.
+
+            Args:
+              model_config (dict): The Co-Op config parameters.
+              destination (dict): The dv360 destination.
+        '''
+        if not self.bq_service.get_table(self.__ledger_table_id(model_config)):
+            self.bq_service.execute_query('sql/create_dv360_uploads_ledger.sql', model_config)
+
+    def select(self, record_batch):
+        '''Keeps the conversions of a batch of get_push_conversions.sql
+        with a dclid that are not in the uploads ledger.'''
+        return record_batch.filter(pc.and_(pc.is_valid(record_batch.column('dclid')),
+                                           pc.invert(record_batch.column('dv360_uploaded'))))
+
+    def upload_conversions(self, model_config, destination, record_batches, max_workers=None):
+        '''Builds and executes offline conversion requests using the Campaign Manager API.
+        Conversions go through the read, build and upload pipeline, so they are
+        uploaded concurrently while the next ones are read with bounded memory.
+        The uploaded conversions are recorded in the uploads ledger of the Co-Op
+        config, only the conversions missing from it are sent in the next runs.
 
             Args:
-              coop_config (CoopCampaignConfig): A pydantic model representing a CoopConfig.???
+              model_config (dict): The Co-Op config parameters.
+              destination (dict): The dv360 destination.
+              record_batches (generator): The record batches of get_push_conversions.sql.
+              max_workers (int): Maximum number of batches uploaded at the same
+              time. Defaults to the DV360_UPLOAD_MAX_WORKERS env variable.
 
             Returns:
-              execution (dict): A dict containing the status of the requests execution
+              execution (dict): The Co-Op config, its status (uploaded, partial or failed),
+              number of conversions and failed conversions and the outcome of each batch.
         '''
-        execution = {
-            "success": [],
-            "errors": []
-        }
-        dv60_cm_params = [destination for destination in model_config.get('destinations')
-            if destination["type"] == 'dv360']
+        max_workers = max_workers or UPLOAD_MAX_WORKERS
         coop_config_name = model_config.get('name')
-        cm_profile_id = dv60_cm_params[0]["cm_profile_id"]
-        floodlight_activity_id = dv60_cm_params[0]["floodlight_activity_id"]
-        floodlight_configuration_id = dv60_cm_params[0]["floodlight_configuration_id"]
-        conversions = self.bq_service.get_table_data(
-            'sql/get_dv360_cm_conversions.sql', model_config)
-        conversions_upload = self.__build_conversions(conversions, floodlight_activity_id,
-            floodlight_configuration_id)
-        # Create conversion batches to handle request limit <= 1000 conversions per request.
-        conversion_batches = [conversions_upload[i:i + 1000]
-                              for i in range(0, len(conversions_upload), 1000)]
-        for index, conversions in enumerate(conversion_batches):
-            request_body = {
-                'conversions': conversions
-            }
-            request = self.service.conversions().batchinsert(
-                profileId=cm_profile_id, body=request_body)
-            response = request.execute()
-            log_message = f'DV30CMService - upload_conversions Co-Op Config {coop_config_name} - ' \
-                 f'Conversions batch {index} CM Profile: {cm_profile_id} ' \
-                 f'Floodlight Activity ID: {floodlight_activity_id} ' \
-                 f'Floodlight Configuration ID: {floodlight_configuration_id}.\n'
-            if response['hasFailures']:
-                status = response['status'][0]
-                for error in status['errors']:
-                    error_code = error['code']
-                    error_message = error['message']
-                    message = f'There was an error while uploading the conversions to DV360/CM: {error_code} - {error_message}'
-                    execution["errors"].append(log_message + message)
-                    logger.error(log_message + message)
-            else:
-                logger.info(log_message + ' was uploaded successfully.')
-                execution["success"].append(log_message + ' was uploaded successfully.')
+        cm_profile_id = destination["cm_profile_id"]
+        floodlight_activity_id = destination["floodlight_activity_id"]
+        floodlight_configuration_id = destination["floodlight_configuration_id"]
+        log_message = f'DV30CMService - upload_conversions Co-Op Config {coop_config_name} - ' \
+            f'CM Profile: {cm_profile_id} ' \
+            f'Floodlight Activity ID: {floodlight_activity_id} ' \
+            f'Floodlight Configuration ID: {floodlight_configuration_id}'
+        # Conversions are regrouped in batches to handle request limit <= 1000 conversions per request.
+        results = run_upload_pipeline(
+            rebatch(record_batches, self.batch_size, self.select),
+            lambda record_batch: build_conversions(record_batch, floodlight_activity_id,
+                                                   floodlight_configuration_id),
+            lambda index, record_batch, conversions: self.__upload_batch(
+                cm_profile_id, log_message, index, record_batch, conversions),
+            max_workers)
+        outcomes = [outcome for outcome, uploaded_keys in results]
+        ledger_error = None
+        try:
+            self.__save_uploaded_keys(model_config, [uploaded_keys for outcome, uploaded_keys in results])
+        except Exception as error:
+            # Conversions missing from the ledger are sent again in the next run, CM deduplicates them.
+            ledger_error = utils.build_error(error)['message']
+            logger.error(f'{log_message} - Error saving the uploads ledger: {ledger_error}')
+        execution = summarize_outcomes(coop_config_name, outcomes, log_message)
+        execution['ledger_error'] = ledger_error
         return execution
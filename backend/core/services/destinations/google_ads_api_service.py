@@ -0,0 +1,233 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import threading
+import pyarrow.compute as pc
+import requests
+import utils
+from google.auth.transport.requests import AuthorizedSession
+from google.oauth2.credentials import Credentials
+from requests.adapters import HTTPAdapter
+from core.services.secret_service import get_oauth_credentials, get_secret
+from .dv360_cm_conversions import column_values
+from .rate_limiter import get_token_bucket
+from .upload_pipeline import execute_with_retries, new_outcome, rebatch, run_upload_pipeline, \
+    summarize_outcomes
+
+LOGGER_NAME = 'coop4all.google_ads_api_service'
+logger = utils.get_coop_logger(LOGGER_NAME)
+# The endpoint can point to a local fake of the API, e.g. benchmarks/fake_google_ads_api.py.
+GOOGLE_ADS_API_ENDPOINT = os.environ.get('GOOGLE_ADS_API_ENDPOINT', 'https://googleads.googleapis.com')
+GOOGLE_ADS_API_VERSION = os.environ.get('GOOGLE_ADS_API_VERSION', 'v20')
+# Google Ads accepts up to 2000 conversions per UploadClickConversions request.
+CONVERSIONS_BATCH_SIZE = 2000
+UPLOAD_MAX_WORKERS = int(os.environ.get('GOOGLE_ADS_UPLOAD_MAX_WORKERS', 4))
+# Requests per second (and burst) allowed per customer, shared by all the uploads of the process.
+REQUESTS_PER_SECOND = float(os.environ.get('GOOGLE_ADS_REQUESTS_PER_SECOND', 5))
+MAX_RETRIES = int(os.environ.get('GOOGLE_ADS_MAX_RETRIES', 5))
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+# Conversions rejected because they were already uploaded count as uploaded.
+DUPLICATE_ERRORS = ('CLICK_CONVERSION_ALREADY_EXISTS', 'DUPLICATE_CLICK_CONVERSION_IN_REQUEST')
+TOKEN_URI = 'https://oauth2.googleapis.com/token'
+API_SCOPES = ['https://www.googleapis.com/auth/adwords']
+
+class GoogleAdsApiService():
+    '''Google Ads service that pushes the click conversions of a Co-Op
+    Configuration with the Google Ads API UploadClickConversions method,
+    in batches with partial failure, concurrency and retries.
+
+    Attributes:
+        bq_service: Service that handles all the BigQuery operations
+        endpoint: The Google Ads API endpoint
+        session: Authorized HTTP session, created from the OAuth secrets on first use
+        developer_token: The Google Ads API developer token
+        batch_size: Number of conversions per UploadClickConversions request
+    '''
+
+    def __init__(self, bq_service, session=None, developer_token=None, endpoint=GOOGLE_ADS_API_ENDPOINT):
+        self.bq_service = bq_service
+        self.endpoint = endpoint
+        self.session = session
+        self.developer_token = developer_token
+        self.batch_size = CONVERSIONS_BATCH_SIZE
+        self.__lock = threading.Lock()
+
+    def __get_session(self):
+        '''Creates the authorized session from the Secret Manager secrets once,
+        its connection pool is shared by all the upload threads.'''
+        with self.__lock:
+            if self.session is None:
+                oauth_credentials = get_oauth_credentials()
+                credentials = Credentials(oauth_credentials.get_access_token(),
+                                          refresh_token=oauth_credentials.get_refresh_token(),
+                                          client_id=oauth_credentials.get_client_id(),
+                                          client_secret=oauth_credentials.get_client_secret(),
+                                          token_uri=TOKEN_URI,
+                                          scopes=API_SCOPES)
+                session = AuthorizedSession(credentials)
+                session.mount('https://', HTTPAdapter(pool_maxsize=UPLOAD_MAX_WORKERS))
+                self.session = session
+            if self.developer_token is None:
+                self.developer_token = get_secret(os.environ.get('COOP_DEVELOPER_TOKEN_SNAME'))
+            return self.session
+
+    def __post(self, destination, method, body):
+        session = self.__get_session()
+        customer_id = destination['customer_id'].replace('-', '')
+        headers = {'developer-token': self.developer_token}
+        if destination.get('login_customer_id'):
+            headers['login-customer-id'] = destination['login_customer_id'].replace('-', '')
+        url = f'{self.endpoint}/{GOOGLE_ADS_API_VERSION}/customers/{customer_id}{method}'
+        response = session.post(url, json=body, headers=headers, timeout=120)
+        response.raise_for_status()
+        return response.json()
+
+    def __is_retryable(self, error):
+        if isinstance(error, requests.HTTPError):
+            return error.response is not None and error.response.status_code in RETRYABLE_STATUSES
+        return isinstance(error, (requests.ConnectionError, requests.Timeout))
+
+    def get_conversion_actions(self, destination):
+        """Gets the conversion actions of the Google Ads customer.
+
+        Args:
+            destination (dict): The google_ads_api destination.
+
+        Returns:
+            conversion_actions (dict): Conversion action name to resource name.
+        """
+
+        query = 'SELECT conversion_action.resource_name, conversion_action.name ' \
+            'FROM conversion_action WHERE conversion_action.status = \'ENABLED\''
+        conversion_actions = {}
+        body = {'query': query}
+        while True:
+            response = self.__post(destination, '/googleAds:search', body)
+            for row in response.get('results', []):
+                conversion_actions[row['conversionAction']['name']] = row['conversionAction']['resourceName']
+            if not response.get('nextPageToken'):
+                return conversion_actions
+            body = {'query': query, 'pageToken': response['nextPageToken']}
+
+    def __build_conversions(self, record_batch, conversion_actions):
+        '''Builds the click conversions of a batch, the conversions without
+        an enabled conversion action of the same name are returned apart.'''
+        conversions = []
+        missing_actions = set()
+        for gclid, name, date_time, value, currency in zip(
+                column_values(record_batch, 'gclid'),
+                column_values(record_batch, 'conversion_name'),
+                column_values(record_batch, 'conversion_date_time'),
+                column_values(record_batch, 'conversion_value'),
+                column_values(record_batch, 'currency_code')):
+            conversion_action = conversion_actions.get(name)
+            if not conversion_action:
+                missing_actions.add(name)
+                continue
+            conversion = {
+                'gclid': gclid,
+                'conversionAction': conversion_action,
+                'conversionDateTime': date_time,
+                'currencyCode': currency
+            }
+            if value is not None:
+                conversion['conversionValue'] = value
+            conversions.append(conversion)
+        return conversions, missing_actions
+
+    def __get_failed_conversions(self, response):
+        '''Reads the partial failure errors of an upload response.
+
+            Returns:
+              failed (dict): The index of each failed conversion, None if the
+              error has no index, to its error message.
+        '''
+        failed = {}
+        failure = response.get('partialFailureError')
+        if not failure:
+            return failed
+        for detail in failure.get('details', []):
+            for error in detail.get('errors', []):
+                codes = list(error.get('errorCode', {}).values())
+                if any(code in DUPLICATE_ERRORS for code in codes):
+                    continue
+                index = next((element.get('index') for element in
+                              error.get('location', {}).get('fieldPathElements', [])
+                              if element.get('fieldName') == 'conversions'), None)
+                failed[index] = f'{codes[0] if codes else failure.get("code")} - {error.get("message")}'
+        return failed
+
+    def __upload_batch(self, destination, log_message, index, record_batch, payload):
+        '''Uploads a batch of click conversions with partial failure, errors
+        are reported in the batch outcome instead of being raised.'''
+        conversions, missing_actions = payload
+        outcome = new_outcome(index, record_batch.num_rows)
+        if missing_actions:
+            outcome['failed_conversions'] = record_batch.num_rows - len(conversions)
+            outcome['errors'].extend(f'CONVERSION_ACTION_NOT_FOUND - {name}' for name in sorted(missing_actions))
+        if conversions:
+            body = {'conversions': conversions, 'partialFailure': True}
+            bucket = get_token_bucket(f'google_ads_customer:{destination["customer_id"]}', REQUESTS_PER_SECOND)
+            try:
+                response = execute_with_retries(
+                    lambda: self.__post(destination, ':uploadClickConversions', body),
+                    self.__is_retryable, bucket, MAX_RETRIES, outcome, log_message)
+                failed = self.__get_failed_conversions(response)
+                outcome['failed_conversions'] += len(conversions) if None in failed else len(failed)
+                outcome['errors'].extend(sorted(set(failed.values())))
+            except Exception as error:
+                outcome['failed_conversions'] += len(conversions)
+                outcome['errors'].append(utils.build_error(error)['message'])
+        if outcome['failed_conversions']:
+            outcome['status'] = 'failed' if outcome['failed_conversions'] == outcome['conversions'] else 'partial'
+        return outcome
+
+    def prepare(self, model_config, destination):
+        '''Nothing to prepare before the push query, the conversion actions
+        are looked up when the upload starts.'''
+
+    def select(self, record_batch):
+        '''Keeps the conversions of a batch of get_push_conversions.sql with a gclid.'''
+        return record_batch.filter(pc.is_valid(record_batch.column('gclid')))
+
+    def upload_conversions(self, model_config, destination, record_batches, max_workers=None):
+        '''Pushes the click conversions of the last days to Google Ads. They are
+        built and uploaded through the upload pipeline, in batches of up to
+        2000 conversions with partial failure, so a rejected conversion does not
+        reject its batch. Google Ads deduplicates the conversions already sent.
+
+            Args:
+              model_config (dict): The Co-Op config parameters.
+              destination (dict): The google_ads_api destination.
+              record_batches (generator): The record batches of get_push_conversions.sql.
+              max_workers (int): Maximum number of batches uploaded at the same
+              time. Defaults to the GOOGLE_ADS_UPLOAD_MAX_WORKERS env variable.
+
+            Returns:
+              execution (dict): The Co-Op config, its status (uploaded, partial or failed),
+              number of conversions and failed conversions and the outcome of each batch.
+        '''
+        max_workers = max_workers or UPLOAD_MAX_WORKERS
+        coop_config_name = model_config.get('name')
+        log_message = f'GoogleAdsApiService - upload_conversions Co-Op Config {coop_config_name} - ' \
+            f'Customer ID: {destination["customer_id"]}'
+        conversion_actions = self.get_conversion_actions(destination)
+        outcomes = run_upload_pipeline(
+            rebatch(record_batches, self.batch_size, self.select),
+            lambda record_batch: self.__build_conversions(record_batch, conversion_actions),
+            lambda index, record_batch, payload: self.__upload_batch(
+                destination, log_message, index, record_batch, payload),
+            max_workers)
+        return summarize_outcomes(coop_config_name, outcomes, log_message)
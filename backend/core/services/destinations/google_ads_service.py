@@ -12,10 +12,22 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import csv
+import hashlib
+import io
+from datetime import datetime, timezone
+from itertools import groupby
+from operator import itemgetter
 import utils
 
 LOGGER_NAME = 'coop4all.google_ads_service'
 logger = utils.get_coop_logger(LOGGER_NAME)
+CONVERSIONS_SQL = 'sql/get_google_ads_conversions.sql'
+BULK_CONVERSIONS_SQL = 'sql/get_google_ads_bulk_conversions.sql'
+# Column of the bulk query with the Co-Op config of each conversion, it is not exported.
+COOP_CONFIG_COLUMN = 'coop_config'
+# First row of each Co-Op config section of a bulk export.
+SECTION_LABEL = 'Co-Op Config'
 
 class GoogleAdsService():
     '''Google Ads service that retrieves conversions for a specific
@@ -28,39 +40,134 @@ class GoogleAdsService():
     def __init__(self, bq_client):
         self.bq_client = bq_client
 
-    def __get_formatted_conversions(self, sql_file, model_config):
-        '''Formats the retrieved rows of the specified query by removing
-        the column underscores to match the conversions format.
+    def get_etag(self, model_config):
+        '''Builds the ETag of the conversions export from the last modified
+        time of the Co-Op table, the rendered query and the current date, as
+        the query reads the last days. The export only changes with them, so
+        the ETag is known without running the query.
 
             Args:
-            sql_file (str): The query to be executed.
+                model_config: A mixed model representing a CoopConfig but including
+            RetailerConfig params.
 
             Returns:
-                conversions (list): A list of formatted conversions
+                etag (str): The export ETag, None if the Co-Op table was not found.
         '''
-        conversions = self.bq_client.get_table_data(sql_file, model_config)
-        for h in conversions.columns.values.tolist():
-            conversions[h.replace("_", " ")] = conversions[h]
-            del conversions[h]
-        return conversions
+        table = self.bq_client.get_table(f'{model_config["retailer_name"]}.{model_config["name"]}')
+        if not table:
+            return None
+        query = self.bq_client.get_query(CONVERSIONS_SQL, model_config)
+        key = '\n'.join([table.modified.isoformat(), datetime.now(timezone.utc).date().isoformat(), query])
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()
 
-    def get_conversions(self, model_config):
-        '''Gets conversions as csv format to be sent to the manufacturer's
-        Google Ads account.
+    def iter_conversions(self, model_config):
+        '''Streams the conversions as csv to be sent to the manufacturer's
+        Google Ads account. The csv is written from each batch of BigQuery
+        rows as it is read, so neither the whole result nor the whole csv
+        is held in memory.
 
             Args:
                 model_config: A mixed model representing a CoopConfig but including
             RetailerConfig params.
 
+            Yields:
+                csv (str): The header line first, then the conversions of a batch
+                of rows, with the required columns and format for Offline
+                Conversions Import in Google Ads.
+        '''
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator='\n')
+        conversion_batches = self.bq_client.iter_table_batches(CONVERSIONS_SQL, model_config)
+        for index, record_batch in enumerate(conversion_batches):
+            if index == 0:
+                # Google Ads expects the column names without underscores.
+                writer.writerow([name.replace('_', ' ') for name in record_batch.schema.names])
+            writer.writerows(zip(*[column.to_pylist() for column in record_batch.columns]))
+            chunk = buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+            if chunk:
+                yield chunk
+
+    def get_bulk_etag(self, model_configs, etags, sections=False):
+        '''Builds the ETag of a bulk conversions export from the ETags of its
+        Co-Op configs, the rendered bulk query and the export format.
+
+            Args:
+                model_configs (list): The Co-Op configs of the export, with their
+            RetailerConfig params.
+                etags (list): The ETag of each Co-Op config export.
+                sections (bool): True for one csv section per Co-Op config.
+
             Returns:
-                csv: A list of conversions as csv format with the required
-                columns and format for Offline Conversions Import in Google Ads.
+                etag (str): The bulk export ETag.
         '''
-        try:
-            conversions = self.__get_formatted_conversions('sql/get_google_ads_conversions.sql', model_config)
-            csv = conversions.to_csv(sep=',', index=False, encoding='utf-8')
-            return csv
-        except Exception as error:
-            logger.error(f'GoogleAdsService - get_conversions - Error getting the conversions' \
-                f'for the Co-Op Config { model_config["name"] } Error: { str(error) }')
-        return None
+        query = self.bq_client.get_query(BULK_CONVERSIONS_SQL, {'coop_configs': model_configs})
+        key = '\n'.join(etags + [f'sections={sections}', query])
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+    def iter_bulk_conversions(self, model_configs, sections=False):
+        '''Streams the conversions of several Co-Op configs as csv, read with a
+        single BigQuery query. The csv has the same columns and format as the
+        export of a single Co-Op config.
+
+            Args:
+                model_configs (list): The Co-Op configs to export, with their
+            RetailerConfig params.
+                sections (bool): False for a combined csv with a single header.
+            True for one section per Co-Op config, in name order: a
+            "Co-Op Config,<name>" row, the header and the config conversions,
+            separated by an empty line. Configs without conversions get an
+            empty section.
+
+            Yields:
+                csv (str): The csv, written from each batch of BigQuery rows as
+                it is read.
+        '''
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator='\n')
+        names = sorted(model_config['name'] for model_config in model_configs)
+        # Sections not written yet, in the order of the query.
+        pending_names = iter(names)
+        current_name = None
+        header = None
+        conversion_batches = self.bq_client.iter_table_batches(
+            BULK_CONVERSIONS_SQL, {'coop_configs': model_configs})
+        for index, record_batch in enumerate(conversion_batches):
+            columns = [name for name in record_batch.schema.names if name != COOP_CONFIG_COLUMN]
+            if index == 0:
+                # Google Ads expects the column names without underscores.
+                header = [name.replace('_', ' ') for name in columns]
+                if not sections:
+                    writer.writerow(header)
+            rows = zip(*[record_batch.column(name).to_pylist() for name in columns])
+            if not sections:
+                writer.writerows(rows)
+            else:
+                coop_configs = record_batch.column(COOP_CONFIG_COLUMN).to_pylist()
+                for name, group in groupby(zip(coop_configs, rows), key=itemgetter(0)):
+                    if name != current_name:
+                        # Also writes the empty sections of the configs before it.
+                        for pending_name in pending_names:
+                            self.__write_section(writer, pending_name, header, pending_name == names[0])
+                            if pending_name == name:
+                                break
+                        current_name = name
+                    writer.writerows(row for coop_config, row in group)
+            chunk = buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+            if chunk:
+                yield chunk
+        if sections:
+            for pending_name in pending_names:
+                self.__write_section(writer, pending_name, header, pending_name == names[0])
+            if buffer.getvalue():
+                yield buffer.getvalue()
+
+    def __write_section(self, writer, name, header, first):
+        if not first:
+            writer.writerow([])
+        writer.writerow([SECTION_LABEL, name])
+        if header is not None:
+            writer.writerow(header)
@@ -0,0 +1,70 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import random
+import threading
+import time
+
+class TokenBucket():
+    '''Thread-safe token bucket that limits the requests sent to an API.
+
+    Attributes:
+        rate: Tokens added per second, the sustained requests per second.
+        capacity: Maximum number of tokens, the allowed burst of requests.
+    '''
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.__lock = threading.Lock()
+
+    def acquire(self):
+        '''Takes a token, waiting until one is available.'''
+        while True:
+            with self.__lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+def get_token_bucket(key, rate, capacity=None):
+    '''Gets the process-wide token bucket of a key (e.g. a CM profile),
+    so all the uploads to the same key share its rate limit.
+
+    Args:
+        key (str): The rate limited resource.
+        rate (float): Requests per second for a new bucket.
+        capacity (int): Burst size for a new bucket.
+
+    Returns:
+        TokenBucket: The bucket of the key.
+    '''
+    with _buckets_lock:
+        if key not in _buckets:
+            _buckets[key] = TokenBucket(rate, capacity)
+        return _buckets[key]
+
+def backoff_delay(attempt, base_seconds, max_seconds):
+    '''Exponential backoff with full jitter for a retry attempt (0 based),
+    a random delay up to base_seconds * 2^attempt capped at max_seconds.'''
+    return random.uniform(0, min(max_seconds, base_seconds * 2 ** attempt))
@@ -0,0 +1,265 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import pyarrow as pa
+import utils
+from .rate_limiter import backoff_delay
+
+LOGGER_NAME = 'coop4all.upload_pipeline'
+logger = utils.get_coop_logger(LOGGER_NAME)
+# Record batches read ahead of the payload builder, bounds the memory of the upload pipeline.
+PIPELINE_QUEUE_SIZE = int(os.environ.get('UPLOAD_PIPELINE_QUEUE_SIZE', 2))
+# Marks the end of the query results in the pipeline queue.
+READ_END = object()
+
+def _put(batches, item, stop):
+    '''Puts an item in the pipeline queue, waiting while it is full
+    unless the pipeline was stopped.'''
+    while not stop.is_set():
+        try:
+            batches.put(item, timeout=1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def _read_batches(record_batches, batches, stop):
+    '''Reader stage of the upload pipeline, runs in its own thread and
+    passes the non empty record batches of the query to the builder through
+    the bounded queue. It ends with READ_END or the read error.'''
+    try:
+        for record_batch in record_batches:
+            if record_batch.num_rows and not _put(batches, record_batch, stop):
+                return
+    except Exception as error:
+        _put(batches, error, stop)
+        return
+    finally:
+        # Stops the BigQuery Storage download threads of an interrupted read.
+        record_batches.close()
+    _put(batches, READ_END, stop)
+
+def _iter_queue(batches, stop):
+    '''Yields the record batches of a fan-out queue until READ_END, raises
+    the read error. Stopping the iteration releases the fan-out reader.'''
+    try:
+        while True:
+            record_batch = batches.get()
+            if record_batch is READ_END:
+                return
+            if isinstance(record_batch, Exception):
+                raise record_batch
+            yield record_batch
+    finally:
+        stop.set()
+
+def _consume(consumer, batches, stop):
+    try:
+        return consumer(_iter_queue(batches, stop))
+    finally:
+        stop.set()
+
+def fan_out(record_batches, consumers, queue_size=PIPELINE_QUEUE_SIZE):
+    '''Reads the record batches once and hands each of them to every
+    consumer. Each consumer runs in its own thread on its own bounded queue,
+    so the read moves at the pace of the slowest consumer with bounded memory,
+    and a consumer that stops reading no longer holds the others.
+
+    Args:
+        record_batches (generator): The record batches of the query.
+        consumers (list): Functions called with an iterator of the record
+        batches. They should not raise.
+        queue_size (int): Maximum number of record batches read ahead per consumer.
+
+    Returns:
+        results (list): The result of each consumer, in the order of the consumers.
+    '''
+    queues = [queue.Queue(maxsize=queue_size) for consumer in consumers]
+    stops = [threading.Event() for consumer in consumers]
+    with ThreadPoolExecutor(max_workers=len(consumers)) as executor:
+        futures = [executor.submit(_consume, consumer, batches, stop)
+                   for consumer, batches, stop in zip(consumers, queues, stops)]
+        end = READ_END
+        try:
+            for record_batch in record_batches:
+                if not record_batch.num_rows:
+                    continue
+                if all(stop.is_set() for stop in stops):
+                    break
+                for batches, stop in zip(queues, stops):
+                    _put(batches, record_batch, stop)
+        except Exception as error:
+            end = error
+        finally:
+            record_batches.close()
+        for batches, stop in zip(queues, stops):
+            _put(batches, end, stop)
+    return [future.result() for future in futures]
+
+def rebatch(record_batches, batch_size, select=None):
+    '''Keeps the rows of each record batch selected for a destination and
+    regroups them in batches of batch_size rows, the last one can be smaller.
+
+    Args:
+        record_batches (generator): The record batches of the query.
+        batch_size (int): Number of rows per batch.
+        select (function): Returns the rows of a record batch to keep.
+
+    Yields:
+        record_batch (pyarrow.RecordBatch): The batches of selected rows.
+    '''
+    pending = []
+    rows = 0
+    try:
+        for record_batch in record_batches:
+            if select:
+                record_batch = select(record_batch)
+            if not record_batch.num_rows:
+                continue
+            pending.append(record_batch)
+            rows += record_batch.num_rows
+            if rows < batch_size:
+                continue
+            table = pa.Table.from_batches(pending)
+            full_rows = rows - rows % batch_size
+            yield from table.slice(0, full_rows).combine_chunks().to_batches(max_chunksize=batch_size)
+            pending = [batch for batch in table.slice(full_rows).to_batches() if batch.num_rows]
+            rows -= full_rows
+        if rows:
+            yield from pa.Table.from_batches(pending).combine_chunks().to_batches(max_chunksize=batch_size)
+    finally:
+        record_batches.close()
+
+def run_upload_pipeline(record_batches, build, upload, max_workers, queue_size=PIPELINE_QUEUE_SIZE):
+    '''Runs a read, build and upload pipeline: a reader thread streams the
+    record batches into a bounded queue, each batch is built in this thread
+    and uploaded on a pool while the next ones are read. At most max_workers
+    batches are in flight, so the memory used stays at a few batches whatever
+    the number of rows.
+
+    Args:
+        record_batches (generator): The record batches of the query.
+        build (function): Builds the payload of a record batch.
+        upload (function): Uploads a payload, called with the batch index,
+        the record batch and the payload. It should not raise.
+        max_workers (int): Maximum number of batches uploaded at the same time.
+        queue_size (int): Maximum number of record batches read ahead.
+
+    Returns:
+        results (list): The result of each upload, in the order of the batches.
+    '''
+    batches = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    reader = threading.Thread(target=_read_batches, args=(record_batches, batches, stop), daemon=True)
+    reader.start()
+    futures = []
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            in_flight = set()
+            while True:
+                record_batch = batches.get()
+                if record_batch is READ_END:
+                    break
+                if isinstance(record_batch, Exception):
+                    raise record_batch
+                if len(in_flight) >= max_workers:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                payload = build(record_batch)
+                future = executor.submit(upload, len(futures), record_batch, payload)
+                in_flight.add(future)
+                futures.append(future)
+    finally:
+        # Stops the reader if the pipeline failed before reading all the results.
+        stop.set()
+    return [future.result() for future in futures]
+
+def execute_with_retries(execute, is_retryable, bucket, max_retries, outcome, log_message,
+                         backoff_seconds=1, backoff_max_seconds=32):
+    '''Executes a request within a rate limit, retrying the retryable errors
+    with jittered exponential backoff. The attempts are counted in the outcome.
+
+    Args:
+        execute (function): Sends the request and returns its response.
+        is_retryable (function): True if an error can be retried.
+        bucket (TokenBucket): The rate limit of the destination.
+        max_retries (int): Maximum number of retries.
+        outcome (dict): The batch outcome.
+        log_message (str): Prefix of the retry logs.
+
+    Returns:
+        response: The response of the request, raises the last error.
+    '''
+    for attempt in range(max_retries + 1):
+        bucket.acquire()
+        outcome['attempts'] = attempt + 1
+        try:
+            return execute()
+        except Exception as error:
+            if attempt == max_retries or not is_retryable(error):
+                raise
+            delay = backoff_delay(attempt, backoff_seconds, backoff_max_seconds)
+            logger.warning(f'{log_message} - Retrying conversions batch {outcome["batch"]} ' \
+                f'in {delay:.1f}s: {utils.build_error(error)["message"]}')
+            time.sleep(delay)
+
+def new_outcome(index, conversions):
+    '''Returns the outcome of a batch before its upload.'''
+    return {
+        'batch': index,
+        'status': 'uploaded',
+        'conversions': conversions,
+        'failed_conversions': 0,
+        'attempts': 0,
+        'errors': []
+    }
+
+def summarize_outcomes(coop_config_name, outcomes, log_message):
+    '''Logs the failed batches and sums up the outcomes of an upload.
+
+    Args:
+        coop_config_name (str): The Co-Op config name.
+        outcomes (list): The outcome of each batch.
+        log_message (str): Prefix of the logs.
+
+    Returns:
+        execution (dict): The Co-Op config, its status (uploaded, partial or failed),
+        number of conversions and failed conversions and the outcome of each batch.
+    '''
+    for outcome in outcomes:
+        if outcome['errors']:
+            logger.error(f'{log_message} - Conversions batch {outcome["batch"]} {outcome["status"]} ' \
+                f'({outcome["failed_conversions"]} of {outcome["conversions"]} conversions failed): ' \
+                f'{"; ".join(outcome["errors"])}')
+    failed_conversions = sum(outcome['failed_conversions'] for outcome in outcomes)
+    conversions = sum(outcome['conversions'] for outcome in outcomes)
+    if not failed_conversions:
+        status = 'uploaded'
+    elif failed_conversions == conversions:
+        status = 'failed'
+    else:
+        status = 'partial'
+    logger.info(f'{log_message} - {conversions - failed_conversions} of {conversions} conversions ' \
+        f'uploaded in {len(outcomes)} batches.')
+    return {
+        'coop_config': coop_config_name,
+        'status': status,
+        'conversions': conversions,
+        'failed_conversions': failed_conversions,
+        'batches': list(outcomes)
+    }
@@ -0,0 +1,39 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+from google.cloud import secretmanager
+from core.models.oauth_credentials import OAuthCredentials
+
+def get_secret(secret_name):
+    '''Gets the latest version of a secret of the project from Secret Manager.
+
+    Args:
+        secret_name (str): The secret name.
+
+    Returns:
+        str: The secret value.
+    '''
+    client = secretmanager.SecretManagerServiceClient()
+    name = f'projects/{os.environ.get("GOOGLE_CLOUD_PROJECT")}/secrets/{secret_name}/versions/latest'
+    response = client.access_secret_version(request={'name': name})
+    return response.payload.data.decode('UTF-8')
+
+def get_oauth_credentials():
+    '''Gets the OAuth credentials to access the Google APIs from the secrets
+    named by the COOP_*_SNAME env variables.'''
+    return OAuthCredentials(get_secret(os.environ.get('COOP_CLIENT_ID_SNAME')),
+                            get_secret(os.environ.get('COOP_CLIENT_SECRET_SNAME')),
+                            get_secret(os.environ.get('COOP_ACCESS_TOKEN_SNAME')),
+                            get_secret(os.environ.get('COOP_REFRESH_TOKEN_SNAME')))
@@ -0,0 +1,102 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import threading
+import time
+import utils
+from jinja2 import FileSystemLoader
+from jinja2.sandbox import SandboxedEnvironment
+
+LOGGER_NAME = 'coop4all.sql_template_registry'
+logger = utils.get_coop_logger(LOGGER_NAME)
+SQL_DIR = os.path.join(os.path.dirname(__file__), os.pardir, 'sql')
+
+def is_dev_mode():
+    '''App Engine sets GAE_ENV to "standard" in production, anything
+    else is treated as a local/dev run.'''
+    return os.environ.get('GAE_ENV') != 'standard'
+
+class SqlTemplateRegistry():
+    '''Registry that loads and compiles all the sql templates under core/sql
+    once and hands back the cached compiled templates.
+
+    Attributes:
+        env: Sandboxed Jinja environment that holds the compiled templates.
+        dev_mode: When True, templates are reloaded if the file mtime changes.
+        stats: Render counters (renders and total render time in seconds).
+    '''
+
+    def __init__(self, sql_dir=SQL_DIR, dev_mode=None):
+        self.dev_mode = is_dev_mode() if dev_mode is None else dev_mode
+        # cache_size=-1 disables the LRU eviction so every template stays compiled.
+        self.env = SandboxedEnvironment(loader=FileSystemLoader(sql_dir),
+                                        auto_reload=self.dev_mode,
+                                        cache_size=-1)
+        self.stats = {
+            'renders': 0,
+            'render_seconds': 0.0
+        }
+        self.__lock = threading.Lock()
+        self.__preload()
+
+    def __preload(self):
+        '''Compiles every sql template so the first render does not pay
+        for file I/O and parsing.'''
+        names = self.env.list_templates(extensions=['sql'])
+        for name in names:
+            self.env.get_template(name)
+        logger.info(f'SqlTemplateRegistry - Compiled {len(names)} sql templates.')
+
+    def __template_name(self, sql_file):
+        '''Normalizes a "sql/<file>.sql" path to the registry template name.'''
+        name = sql_file.replace(os.sep, '/')
+        return name[len('sql/'):] if name.startswith('sql/') else name
+
+    def get_template(self, sql_file):
+        '''Gets the compiled template of a sql file.
+
+        Args:
+            sql_file (str): Path to the sql file, relative to core/.
+
+        Returns:
+            jinja2.Template: The cached compiled template.
+        '''
+        return self.env.get_template(self.__template_name(sql_file))
+
+    def render(self, sql_file, query_params):
+        '''Renders a sql template with the query parameters.
+
+        Args:
+            sql_file (str): Path to the sql file, relative to core/.
+            query_params (dict): Parameters to include in the query.
+
+        Returns:
+            A string representing the sql query.
+        '''
+        template = self.get_template(sql_file)
+        start = time.perf_counter()
+        query = template.render(params=query_params)
+        elapsed = time.perf_counter() - start
+        with self.__lock:
+            self.stats['renders'] += 1
+            self.stats['render_seconds'] += elapsed
+        return query
+
+    def get_stats(self):
+        '''Returns a copy of the render counters.'''
+        with self.__lock:
+            return dict(self.stats)
+
+registry = SqlTemplateRegistry()
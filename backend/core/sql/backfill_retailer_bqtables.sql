@@ -0,0 +1,30 @@
+/*
+Copyright 2021 Google LLC
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+  https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+*/
+
+-- Backfills one chunk of days of all_clicks and all_transactions for a RetailerConfig.
+
+-- The days of the chunk are deleted before loading them, so a chunk can be retried or resumed
+-- without duplicating rows. The deletes only touch the partitions of the chunk.
+
+DECLARE from_partition DATE DEFAULT DATE '{{ params['from_date'] }}';
+DECLARE to_partition DATE DEFAULT DATE '{{ params['to_date'] }}';
+
+DELETE {{ params['name'] }}.all_transactions
+WHERE transaction_date BETWEEN from_partition AND to_partition;
+
+DELETE {{ params['name'] }}.all_clicks
+WHERE click_date BETWEEN from_partition AND to_partition;
+
+{% include 'load_retailer_tables.sql' %}
@@ -0,0 +1,79 @@
+/*
+Copyright 2021 Google LLC
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+  https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+*/
+
+-- Builds all the ready CoopCampaingConfiguration tables of a retailer in one script.
+
+-- all_clicks and all_transactions are joined once into the coop_joined temp table, for the union of
+-- the utm_campaigns and the widest attribution_window of the configs. Each coop table is then built
+-- from coop_joined with its own campaigns, filters and attribution window. A failing config does not
+-- stop the others, the script returns the name and error of each failed config.
+
+{% import 'coop_macros.sql' as coop %}
+{% set coop_configs = params['coop_configs'] %}
+{% set utm_campaigns = coop_configs | map(attribute='utm_campaigns') | sum(start=[]) | unique | list %}
+{% set max_window = coop_configs | map(attribute='attribution_window') | max %}
+{% set backfill = params['coop_max_backfill'] %}
+
+DECLARE start_date DATE;
+DECLARE shared_start_date DATE DEFAULT DATE '1970-01-01'; -- Full rebuilds read the whole history
+DECLARE failed_configs ARRAY<STRUCT<coop_config STRING, error STRING>> DEFAULT [];
+
+{% if coop_configs | rejectattr('incremental') | list | length == 0 %}
+SET shared_start_date = ( -- Incremental refreshes only need the days since the oldest latest processed day
+  SELECT
+    MIN(IFNULL(latest_date, DATE_SUB(CURRENT_DATE(), INTERVAL {{ backfill }} DAY)))
+  FROM (
+    {% for coop_config in coop_configs %}
+    SELECT MAX(transaction_date) AS latest_date FROM {{ params['retailer_name'] }}.{{ coop_config['name'] }}
+    {% if not loop.last %}UNION ALL{% endif %}
+    {% endfor %}
+  )
+);
+{% endif %}
+
+CREATE TEMP TABLE coop_joined AS
+SELECT
+  t.* EXCEPT(user_pseudo_id, session_number),
+  c.coop_campaign,
+  c.coop_gclid,
+  c.coop_dclid,
+  c.click_datetime
+FROM
+  {{ params['retailer_name'] }}.all_clicks c
+INNER JOIN
+  {{ params['retailer_name'] }}.all_transactions t
+USING(user_pseudo_id)
+WHERE
+  c.click_datetime <= t.transaction_datetime -- To get a click that is before a transaction
+  AND c.click_datetime >= DATE_SUB(t.transaction_datetime, INTERVAL {{ max_window }} DAY) -- Within the widest attribution window
+  AND c.coop_campaign IN ({{ utm_campaigns | map('tojson') | join(', ') }})
+  AND t.transaction_date >= shared_start_date
+  AND c.click_date >= DATE_SUB(shared_start_date, INTERVAL {{ max_window }} DAY);
+
+{% for coop_config in coop_configs %}
+BEGIN
+  {% if coop_config['incremental'] %}
+  {{ coop.merge(coop_config, shared_join=true) }};
+  {% else %}
+  {{ coop.rebuild(coop_config, shared_join=true) }};
+  {% endif %}
+EXCEPTION WHEN ERROR THEN
+  SET failed_configs = ARRAY_CONCAT(failed_configs, [STRUCT('{{ coop_config['name'] }}' AS coop_config, @@error.message AS error)]);
+END;
+{% endfor %}
+
+DROP TABLE coop_joined;
+
+SELECT coop_config, error FROM UNNEST(failed_configs); -- The result of the script job
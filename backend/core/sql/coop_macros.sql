@@ -0,0 +1,160 @@
+/*
+Copyright 2021 Google LLC
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+  https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+*/
+
+-- Macros to build CoopCampaingConfiguration tables, imported by create_or_update_coop.sql,
+-- merge_coop.sql and batch_coop.sql.
+
+{#
+  Coop rows for a CoopCampaingConfiguration.
+
+  Joins all_transactions and all_clicks.
+  Filters specific products from all_transactions.
+  Filters specific utm_campaings from all_clicks.
+  Filters sessions that occurs within an attribution_window (in days) before a transaction.
+  When incremental is set, only transactions from start_date (a script variable) are processed.
+  When shared_join is set, rows are read from the coop_joined temp table built by batch_coop.sql.
+#}
+{% macro attribution(params, incremental=false, shared_join=false) %}
+WITH coop_transactions AS (
+{% if shared_join %}
+SELECT
+  *
+FROM
+  coop_joined
+WHERE
+  click_datetime >= DATE_SUB(transaction_datetime, INTERVAL {{ params['attribution_window'] }} DAY) -- Within the attribution window of this config
+{% else %}
+SELECT
+  t.* EXCEPT(user_pseudo_id, session_number),
+  c.coop_campaign,
+  c.coop_gclid,
+  c.coop_dclid,
+  c.click_datetime
+FROM
+  {{ params['retailer_name'] }}.all_clicks c
+INNER JOIN
+  {{ params['retailer_name'] }}.all_transactions t
+USING(user_pseudo_id)
+WHERE
+  c.click_datetime <= t.transaction_datetime -- To get a click that is before a transaction
+  AND c.click_datetime >= DATE_SUB(t.transaction_datetime, INTERVAL {{ params['attribution_window'] }} DAY) -- And within the attribution window (30 days by default)
+  {% if incremental %}
+  AND c.click_date >= DATE_SUB(start_date, INTERVAL {{ params['attribution_window'] }} DAY) -- Plus the trailing attribution window
+  {% endif %}
+{% endif %}
+  AND coop_campaign IN ({{ params['utm_campaigns'] | map('tojson') | join(', ')}})
+  {% for filter in params['filters'] %}
+  AND {{ filter['type'] }} IN ({{filter['data'] | map('tojson') | join(', ')}})
+  {% endfor %}
+  {% if incremental %}
+  AND transaction_date >= start_date -- Only new partitions
+  {% endif %}
+)
+SELECT
+  transaction_id,
+  transaction_date,
+  transaction_datetime,
+  transaction_timestamp,
+  coop_campaign,
+  coop_gclid,
+  coop_dclid,
+  item_id,
+  item_name,
+  item_brand,
+  quantity,
+  ROUND(price, 2) AS price,
+  ROUND(quantity * price, 2) AS item_revenue,
+  '{{ params['name'] }}' AS coop_name,
+  event_name
+FROM (
+  SELECT
+    transaction_id,
+    MAX(click_datetime) AS click_datetime -- Transactions might be duplicated, the latest is selected
+  FROM
+    coop_transactions
+  GROUP BY 1)
+INNER JOIN
+  coop_transactions
+USING (transaction_id, click_datetime)
+{% endmacro %}
+
+{# True when the coop table is not partitioned yet (or does not exist). #}
+{% macro not_partitioned(params) %}
+NOT EXISTS (
+  SELECT
+    1
+  FROM
+    {{ params['retailer_name'] }}.INFORMATION_SCHEMA.COLUMNS
+  WHERE
+    table_name = '{{ params['name'] }}'
+    AND is_partitioning_column = 'YES')
+{% endmacro %}
+
+{#
+  Full rebuild of a coop table over the whole retailer history.
+  Coop tables are partitioned by transaction_date and clustered by the click ids so the conversion
+  queries only scan the days they pull. Their partitions expire after coop_max_backfill days, like
+  the all_transactions partitions they are built from. Tables created before partitioning are dropped first since
+  a table cannot be replaced with a different partitioning spec.
+#}
+{% macro rebuild(params, shared_join=false) %}
+IF {{ not_partitioned(params) }} THEN
+  DROP TABLE IF EXISTS {{ params['retailer_name'] }}.{{ params['name'] }};
+END IF;
+
+CREATE OR REPLACE TABLE
+  {{ params['retailer_name'] }}.{{ params['name']}} -- The table is always replaced with new data
+PARTITION BY
+  transaction_date
+CLUSTER BY
+  coop_gclid, coop_dclid
+OPTIONS
+  (partition_expiration_days={{ params['coop_max_backfill'] }}) -- Same window as all_transactions
+AS
+{{ attribution(params, shared_join=shared_join) }}
+{% endmacro %}
+
+{#
+  Incremental refresh of an existing coop table, the calling script declares start_date.
+  Only the transactions from the latest processed day onwards are recomputed, joined with the clicks
+  of the trailing attribution window. The recomputed days replace the existing ones in a single MERGE,
+  so the refresh is idempotent and older partitions are never rescanned.
+  Tables that are not partitioned yet are migrated with a full rebuild. It never reads the shared join,
+  which only holds the days an incremental batch refreshes, so the history of the table is kept.
+#}
+{% macro merge(params, shared_join=false) %}
+IF {{ not_partitioned(params) }} THEN
+  {{ rebuild(params) }};
+ELSE
+  -- Keeps the tables created before the partition expiration within the window too
+  ALTER TABLE {{ params['retailer_name'] }}.{{ params['name'] }}
+  SET OPTIONS (partition_expiration_days={{ params['coop_max_backfill'] }});
+
+  SET start_date = IFNULL(
+    (SELECT MAX(transaction_date) FROM {{ params['retailer_name'] }}.{{ params['name'] }}), -- The latest day is reprocessed since it might have been loaded partially
+    DATE_SUB(CURRENT_DATE(), INTERVAL {{ params['coop_max_backfill'] }} DAY));
+
+  MERGE
+    {{ params['retailer_name'] }}.{{ params['name'] }} T
+  USING (
+  {{ attribution(params, incremental=true, shared_join=shared_join) }}
+  ) S
+  ON FALSE
+  WHEN NOT MATCHED BY SOURCE AND T.transaction_date >= start_date THEN
+    DELETE
+  WHEN NOT MATCHED THEN
+    INSERT ROW;
+END IF
+{% endmacro %}
@@ -0,0 +1,30 @@
+/*
+ * Copyright 2021 Google LLC
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+
+ * https://www.apache.org/licenses/LICENSE-2.0
+
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ *limitations under the License.
+*/
+
+/*
+ * Creates the ledger of the conversions of a Co-Op Configuration already
+ * uploaded to DV360/CM, one row per conversion key. Uploads are only looked
+ * up for the last 5 days, so the partitions expire after a week.
+*/
+
+CREATE TABLE IF NOT EXISTS {{ params['retailer_name'] }}.{{ params['name'] }}_dv360_uploads (
+    dclid STRING,
+    conversion_timestamp INTEGER,
+    event_name STRING,
+    uploaded_at TIMESTAMP
+)
+PARTITION BY DATE(uploaded_at)
+CLUSTER BY dclid
+OPTIONS (partition_expiration_days = 7)
@@ -18,6 +18,9 @@ limitations under the License.
 -- Table all_clicks contains all sessions with a gclid or dclid as an event_parameter.
 -- Table all_transactions purchase events with ecommerce information.
 
+DECLARE from_partition DATE DEFAULT DATE_SUB(CURRENT_DATE(), INTERVAL 3 DAY);
+DECLARE to_partition DATE DEFAULT CURRENT_DATE('{{ params['time_zone'] }}');
+
 CREATE SCHEMA IF NOT EXISTS {{ params['name'] }};
 
 CREATE TABLE IF NOT EXISTS
@@ -38,38 +41,11 @@ CREATE TABLE IF NOT EXISTS
 )
 PARTITION BY
   transaction_date
+CLUSTER BY
+  user_pseudo_id -- Join key of the coop builds
 OPTIONS
   (partition_expiration_days={{ params['coop_max_backfill'] }}); -- 90 days by default
 
-INSERT
-  {{ params['name'] }}.all_transactions
-SELECT DISTINCT
-  user_pseudo_id,
-  PARSE_DATE('%Y%m%d', event_date) AS transaction_date,
-  DATETIME(TIMESTAMP_MICROS(event_timestamp),'{{ params['time_zone'] }}') AS transaction_datetime,
-  event_timestamp as transaction_timestamp,
-  (SELECT value.string_value FROM UNNEST(event_params) WHERE key = 'transaction_id') AS transaction_id,
-  (SELECT value.int_value FROM UNNEST(event_params) WHERE key = 'ga_session_number') AS session_number,
-  it.item_id,
-  it.item_name,
-  it.item_brand,
-  it.quantity,
-  it.price,
-  it.item_revenue,
-  event_name
-FROM `{{ params['bq_ga_table'] }}`, UNNEST(items) it
-WHERE
-  event_name IN ('purchase', 'add_to_cart', 'begin_checkout', 'view_item')
-  AND _TABLE_SUFFIX BETWEEN FORMAT_DATE('%Y%m%d',DATE_SUB(CURRENT_DATE(), INTERVAL 3 DAY))
-  AND FORMAT_DATE('%Y%m%d',CURRENT_DATE('{{ params['time_zone'] }}'));
-
--- transaction_id is mandatory just for the purchase event because of deduplication proposes. if it is not set, the purchase will not be considered.
--- If it is not set for the others events, those are set randomly.
-UPDATE {{ params['name'] }}.all_transactions
-SET transaction_id = CONCAT('autogen-', transaction_timestamp)
-WHERE event_name != 'purchase' AND transaction_id IS NULL;
-
-
 CREATE TABLE IF NOT EXISTS
   {{ params['name'] }}.all_clicks(
     user_pseudo_id STRING,
@@ -82,32 +58,9 @@ CREATE TABLE IF NOT EXISTS
 )
 PARTITION BY
   click_date
+CLUSTER BY
+  coop_campaign, user_pseudo_id -- Coop builds filter by campaign and join by user
 OPTIONS
   (partition_expiration_days={{ params['coop_max_backfill'] }} + 30); -- To account for attribution. The transaction could happen on the first day, and a click has to happen within 30 days prior.
 
-INSERT
-  {{ params['name'] }}.all_clicks
-SELECT
-  user_pseudo_id,
-  session_number,
-  coop_campaign,
-  coop_gclid,
-  coop_dclid,
-  click_date,
-  MIN(event_datetime) AS click_datetime -- The first occurrence of gclid in an event, there could be several events with the same gclid (page view, etc)
-FROM (
-  SELECT
-    user_pseudo_id,
-    PARSE_DATE('%Y%m%d', event_date) AS click_date,
-    DATETIME(TIMESTAMP_MICROS(event_timestamp),'{{ params['time_zone'] }}') event_datetime,
-    (SELECT value.int_value FROM UNNEST(event_params) WHERE key = 'ga_session_number') as session_number,
-    (SELECT value.string_value FROM UNNEST(event_params) WHERE key = 'campaign') as coop_campaign,
-    (SELECT value.string_value FROM UNNEST(event_params) WHERE key = 'gclid') as coop_gclid,
-    (SELECT value.string_value FROM UNNEST(event_params) WHERE key = 'dclid') as coop_dclid
-  FROM
-    `{{ params['bq_ga_table'] }}`
-  WHERE
-    _TABLE_SUFFIX BETWEEN FORMAT_DATE('%Y%m%d',DATE_SUB(CURRENT_DATE(), INTERVAL 3 DAY))
-    AND FORMAT_DATE('%Y%m%d',CURRENT_DATE('{{ params['time_zone'] }}')))
-WHERE coop_gclid IS NOT NULL OR coop_dclid IS NOT NULL
-GROUP BY 1,2,3,4,5,6
+{% include 'load_retailer_tables.sql' %}
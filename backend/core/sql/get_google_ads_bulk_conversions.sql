@@ -0,0 +1,30 @@
+/*
+ * Copyright 2021 Google LLC
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+
+ * https://www.apache.org/licenses/LICENSE-2.0
+
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ *limitations under the License.
+*/
+
+/*
+ * Retrieves the Google Ads conversions of several Co-Op Configurations in a single
+ * query, the union of get_google_ads_conversions.sql for each config in
+ * params['coop_configs'], tagged with the config name and ordered by it so the
+ * conversions of each config are read together.
+*/
+
+{% for coop_config in params['coop_configs'] %}
+{% if not loop.first %}UNION ALL{% endif %}
+SELECT conversions.*, '{{ coop_config['name'] }}' AS coop_config
+FROM (
+    {% with params = coop_config %}{% include 'get_google_ads_conversions.sql' %}{% endwith %}
+) AS conversions
+{% endfor %}
+ORDER BY coop_config
@@ -33,7 +33,9 @@ SELECT
     '{{ params['currency'] }}' AS Conversion_Currency
 FROM {{ params['retailer_name'] }}.{{ params['name']}}
 WHERE
-    transaction_datetime BETWEEN CAST(FORMAT_DATE('%Y-%m-%d', DATE_SUB(CURRENT_DATE(), INTERVAL 5 DAY)) AS DATE)
+    -- Coop tables are partitioned by transaction_date, this filter prunes the partitions to scan
+    transaction_date BETWEEN DATE_SUB(CURRENT_DATE(), INTERVAL 5 DAY) AND CURRENT_DATE()
+    AND transaction_datetime BETWEEN CAST(FORMAT_DATE('%Y-%m-%d', DATE_SUB(CURRENT_DATE(), INTERVAL 5 DAY)) AS DATE)
     AND CAST(FORMAT_DATE('%Y-%m-%d', CURRENT_DATE()) AS DATE)
     AND coop_gclid IS NOT NULL
 GROUP BY coop_gclid, transaction_datetime, event_name
\ No newline at end of file
@@ -0,0 +1,54 @@
+/*
+ * Copyright 2021 Google LLC
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+
+ * https://www.apache.org/licenses/LICENSE-2.0
+
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ *limitations under the License.
+*/
+
+/*
+ * Retrieves the daily bytes scanned by the Co-Op jobs, grouped by job type and retailer,
+ * to compare the cost of the table builds before and after a schema change.
+ * The jobs are identified by the coop_job label set by the BigqueryService. The jobs run
+ * before the labels by params['user_email'] are reported as unlabeled_<statement type>:
+ * the coop builds were single CREATE TABLE AS SELECT statements, reported with the dataset
+ * of their table as retailer, and the retailer table updates were scripts, with no retailer.
+*/
+
+WITH coop_jobs AS (
+    SELECT
+        creation_time,
+        (SELECT value FROM UNNEST(labels) WHERE key = 'coop_job') AS job_label,
+        (SELECT value FROM UNNEST(labels) WHERE key = 'retailer') AS retailer_label,
+        statement_type,
+        user_email,
+        destination_table.dataset_id AS destination_dataset,
+        total_bytes_processed,
+        total_bytes_billed
+    FROM `region-{{ params['location'] | lower }}`.INFORMATION_SCHEMA.JOBS_BY_PROJECT
+    WHERE
+        creation_time >= TIMESTAMP_SUB(CURRENT_TIMESTAMP(), INTERVAL {{ params['days'] }} DAY)
+        AND parent_job_id IS NULL -- Only the parent job of each script, to avoid counting bytes twice
+)
+SELECT
+    DATE(creation_time) AS job_date,
+    IFNULL(job_label, CONCAT('unlabeled_', LOWER(statement_type))) AS job_type,
+    IFNULL(retailer_label, IF(statement_type = 'SCRIPT', NULL, destination_dataset)) AS retailer,
+    COUNT(*) AS jobs,
+    SUM(total_bytes_processed) AS total_bytes_processed,
+    SUM(total_bytes_billed) AS total_bytes_billed
+FROM coop_jobs
+WHERE
+    (job_label IS NOT NULL AND statement_type = 'SCRIPT')
+    OR (job_label IS NULL
+        AND user_email = '{{ params['user_email'] }}'
+        AND statement_type IN ('SCRIPT', 'CREATE_TABLE_AS_SELECT'))
+GROUP BY 1, 2, 3
+ORDER BY 1, 2, 3
@@ -0,0 +1,81 @@
+/*
+ * Copyright 2021 Google LLC
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+
+ * https://www.apache.org/licenses/LICENSE-2.0
+
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ *limitations under the License.
+*/
+
+/*
+ * Retrieves the conversions from the last 5 days for the specified Co-Op Configuration,
+ * once for all its push destinations: the rows carry the click IDs and formats of every
+ * destination in params['destination_types'] and each destination keeps its own rows.
+ * Since DV360/CM and Google Ads deduplicate conversions, it is safe to send the same
+ * conversions for some days to cover any missing days due to data availability.
+ * The DV360/CM conversions in the uploads ledger were already sent and are flagged with
+ * dv360_uploaded, unless force_resend is set.
+*/
+
+{% set destination_types = params.get('destination_types', []) %}
+{% set dv360_ledger = 'dv360' in destination_types and not params.get('force_resend') %}
+WITH conversions AS (
+    SELECT
+        coop_gclid AS gclid,
+        coop_dclid AS dclid,
+        -- backward compatibility with previous version without events
+        CASE
+            WHEN event_name IS NULL THEN 'Offline_Conversions_{{ params['name'] }}_Co-Op4All'
+            ELSE CONCAT('{{ params['name'] }}_', event_name, '_Co-Op4All')
+        END AS conversion_name,
+        IFNULL(event_name, '') AS event_name,
+        transaction_timestamp AS conversion_timestamp,
+        -- The Google Ads API expects the date time with its UTC offset, e.g. 2021-01-01 12:32:45-08:00
+        FORMAT_TIMESTAMP('%F %T%Ez', TIMESTAMP(transaction_datetime, '{{ params['time_zone'] }}'),
+            '{{ params['time_zone'] }}') AS conversion_date_time,
+        SUM(quantity) AS conversion_quantity,
+        SUM(item_revenue) AS conversion_value,
+        '{{ params['currency'] }}' AS currency_code
+    FROM {{ params['retailer_name'] }}.{{ params['name']}} AS coop
+    WHERE
+        -- Coop tables are partitioned by transaction_date, this filter prunes the partitions to scan
+        transaction_date BETWEEN DATE_SUB(CURRENT_DATE(), INTERVAL 5 DAY) AND CURRENT_DATE()
+        AND transaction_datetime BETWEEN CAST(FORMAT_DATE('%Y-%m-%d', DATE_SUB(CURRENT_DATE(), INTERVAL 5 DAY)) AS DATE)
+        AND CAST(FORMAT_DATE('%Y-%m-%d', CURRENT_DATE()) AS DATE)
+        AND (FALSE
+            {% if 'google_ads_api' in destination_types %} OR coop_gclid IS NOT NULL {% endif %}
+            {% if 'dv360' in destination_types %} OR coop_dclid IS NOT NULL {% endif %})
+    -- Qualified, event_name is also the alias of IFNULL(event_name, '')
+    GROUP BY coop.coop_gclid, coop.coop_dclid, coop.transaction_timestamp, coop.transaction_datetime, coop.event_name
+),
+flagged_conversions AS (
+    SELECT
+        conversions.*,
+        {% if dv360_ledger %}
+        EXISTS (
+            SELECT 1
+            FROM {{ params['retailer_name'] }}.{{ params['name'] }}_dv360_uploads AS uploads
+            WHERE
+                uploads.uploaded_at >= TIMESTAMP(DATE_SUB(CURRENT_DATE(), INTERVAL 7 DAY))
+                AND uploads.dclid = conversions.dclid
+                AND uploads.conversion_timestamp = conversions.conversion_timestamp
+                AND uploads.event_name = conversions.event_name
+        ) AS dv360_uploaded
+        {% else %}
+        FALSE AS dv360_uploaded
+        {% endif %}
+    FROM conversions
+)
+SELECT *
+FROM flagged_conversions
+-- Rows left for no destination are not read
+WHERE FALSE
+    {% if 'google_ads_api' in destination_types %} OR gclid IS NOT NULL {% endif %}
+    {% if 'dv360' in destination_types %} OR (dclid IS NOT NULL AND NOT dv360_uploaded) {% endif %}
+ORDER BY conversion_timestamp
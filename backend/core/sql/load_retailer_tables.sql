@@ -0,0 +1,84 @@
+/*
+Copyright 2021 Google LLC
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+  https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+*/
+
+-- Loads all_transactions and all_clicks for a RetailerConfig, included by create_retailer_bqtables.sql
+-- and update_retailer_bqtables.sql. The calling script declares from_partition and to_partition.
+
+-- The GA4 shards are read once into a staging table with the event_params extracted once,
+-- both tables are written from the staging table.
+
+CREATE TEMP TABLE ga_events AS
+SELECT
+  *
+FROM (
+  SELECT
+    user_pseudo_id,
+    event_name,
+    event_timestamp,
+    PARSE_DATE('%Y%m%d', event_date) AS event_date,
+    DATETIME(TIMESTAMP_MICROS(event_timestamp),'{{ params['time_zone'] }}') AS event_datetime,
+    -- Items are only needed for the ecommerce events
+    IF(event_name IN ('purchase', 'add_to_cart', 'begin_checkout', 'view_item'), items, []) AS items,
+    (SELECT value.string_value FROM UNNEST(event_params) WHERE key = 'transaction_id') AS transaction_id,
+    (SELECT value.int_value FROM UNNEST(event_params) WHERE key = 'ga_session_number') AS session_number,
+    (SELECT value.string_value FROM UNNEST(event_params) WHERE key = 'campaign') AS coop_campaign,
+    (SELECT value.string_value FROM UNNEST(event_params) WHERE key = 'gclid') AS coop_gclid,
+    (SELECT value.string_value FROM UNNEST(event_params) WHERE key = 'dclid') AS coop_dclid
+  FROM
+    `{{ params['bq_ga_table'] }}`
+  WHERE
+    _TABLE_SUFFIX BETWEEN FORMAT_DATE('%Y%m%d', from_partition)
+    AND FORMAT_DATE('%Y%m%d', to_partition))
+WHERE
+  ARRAY_LENGTH(items) > 0 -- Ecommerce events for all_transactions
+  OR coop_gclid IS NOT NULL -- Clicks for all_clicks
+  OR coop_dclid IS NOT NULL;
+
+INSERT
+  {{ params['name'] }}.all_transactions
+SELECT DISTINCT
+  user_pseudo_id,
+  event_date AS transaction_date,
+  event_datetime AS transaction_datetime,
+  event_timestamp as transaction_timestamp,
+  -- transaction_id is mandatory just for the purchase event because of deduplication proposes. if it is not set, the purchase will not be considered.
+  -- If it is not set for the others events, those are set randomly.
+  IF(transaction_id IS NULL AND event_name != 'purchase',
+    CONCAT('autogen-', event_timestamp), transaction_id) AS transaction_id,
+  session_number,
+  it.item_id,
+  it.item_name,
+  it.item_brand,
+  it.quantity,
+  it.price,
+  it.item_revenue,
+  event_name
+FROM ga_events, UNNEST(items) it;
+
+INSERT
+  {{ params['name'] }}.all_clicks
+SELECT
+  user_pseudo_id,
+  session_number,
+  coop_campaign,
+  coop_gclid,
+  coop_dclid,
+  event_date AS click_date,
+  MIN(event_datetime) AS click_datetime -- The first occurrence of gclid in an event, there could be several events with the same gclid (page view, etc)
+FROM ga_events
+WHERE coop_gclid IS NOT NULL OR coop_dclid IS NOT NULL
+GROUP BY 1,2,3,4,5,6;
+
+DROP TABLE ga_events;
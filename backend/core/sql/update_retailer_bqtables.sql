@@ -15,11 +15,11 @@ limitations under the License.
 
 -- Updates all_clicks and all_transactions tables for a RetailerConfig
 
-DECLARE next_partition DATE;
-DECLARE latest_partition DATE;
+DECLARE from_partition DATE;
+DECLARE to_partition DATE;
 
-SET latest_partition = DATE_SUB(CURRENT_DATE('{{ params['time_zone'] }}'), INTERVAL 1 DAY); -- Get latest partition to process, which is 'yesterday'
-SET next_partition = ( -- Get latest created/existing partition in BQ (the date until the data was processed correctly, could be N days ago)
+SET to_partition = DATE_SUB(CURRENT_DATE('{{ params['time_zone'] }}'), INTERVAL 1 DAY); -- Get latest partition to process, which is 'yesterday'
+SET from_partition = ( -- Get latest created/existing partition in BQ (the date until the data was processed correctly, could be N days ago)
     SELECT
       DATE_ADD(PARSE_DATE('%Y%m%d', MAX(partition_id)), INTERVAL 1 DAY)
     FROM
@@ -34,58 +34,36 @@ ALTER TABLE {{ params['name']}}.all_transactions
     ADD COLUMN IF NOT EXISTS event_name STRING;
 -- IMPORTANT: future new columns should be added one after each alter so the insert/select below follows columns order.
 
-INSERT
-  {{ params['name'] }}.all_transactions
-SELECT DISTINCT
-  user_pseudo_id,
-  PARSE_DATE('%Y%m%d', event_date) AS transaction_date,
-  DATETIME(TIMESTAMP_MICROS(event_timestamp),'{{ params['time_zone'] }}') AS transaction_datetime,
-  event_timestamp as transaction_timestamp,
-  (SELECT value.string_value FROM UNNEST(event_params) WHERE key = 'transaction_id') AS transaction_id,
-  (SELECT value.int_value FROM UNNEST(event_params) WHERE key = 'ga_session_number') AS session_number,
-  it.item_id,
-  it.item_name,
-  it.item_brand,
-  it.quantity,
-  it.price,
-  it.item_revenue,
-  event_name
-FROM `{{ params['bq_ga_table'] }}`, UNNEST(items) it
-WHERE
-  event_name IN ('purchase', 'add_to_cart', 'begin_checkout', 'view_item')
-  AND _TABLE_SUFFIX BETWEEN FORMAT_DATE('%Y%m%d', next_partition)
-  AND FORMAT_DATE('%Y%m%d', latest_partition);
+-- Version: Clustered tables. Tables created before clustering are rewritten in place once,
+-- keeping the same partitioning and expiration.
+IF NOT EXISTS (
+  SELECT 1 FROM {{ params['name'] }}.INFORMATION_SCHEMA.COLUMNS
+  WHERE table_name = 'all_transactions' AND clustering_ordinal_position IS NOT NULL) THEN
+  CREATE OR REPLACE TABLE
+    {{ params['name'] }}.all_transactions
+  PARTITION BY
+    transaction_date
+  CLUSTER BY
+    user_pseudo_id
+  OPTIONS
+    (partition_expiration_days={{ params['coop_max_backfill'] }})
+  AS
+  SELECT * FROM {{ params['name'] }}.all_transactions;
+END IF;
 
--- transaction_id is mandatory just for the purchase event because of deduplication proposes. if it is not set, the purchase will not be considered.
--- If it is not set for the others events, those are set randomly.
-UPDATE {{ params['name'] }}.all_transactions
-SET transaction_id = CONCAT('autogen-', transaction_timestamp)
-WHERE event_name != 'purchase' AND transaction_id IS NULL;
-
-INSERT
-  {{ params['name'] }}.all_clicks
-SELECT
-  user_pseudo_id,
-  session_number,
-  coop_campaign,
-  coop_gclid,
-  coop_dclid,
-  click_date,
-  MIN(event_datetime) AS click_datetime
-FROM (
-  SELECT
-    user_pseudo_id,
-    PARSE_DATE('%Y%m%d', event_date) AS click_date,
-    DATETIME(TIMESTAMP_MICROS(event_timestamp),'{{ params['time_zone'] }}') event_datetime,
-    (SELECT value.int_value FROM UNNEST(event_params) WHERE key = 'ga_session_number') as session_number,
-    (SELECT value.string_value FROM UNNEST(event_params) WHERE key = 'campaign') as coop_campaign,
-    (SELECT value.string_value FROM UNNEST(event_params) WHERE key = 'gclid') as coop_gclid,
-    (SELECT value.string_value FROM UNNEST(event_params) WHERE key = 'dclid') as coop_dclid
-  FROM
-    `{{ params['bq_ga_table'] }}`
-  WHERE
-    _TABLE_SUFFIX BETWEEN FORMAT_DATE('%Y%m%d', next_partition)
-    AND FORMAT_DATE('%Y%m%d', latest_partition))
-WHERE coop_gclid IS NOT NULL OR coop_dclid IS NOT NULL
-GROUP BY 1,2,3,4,5,6;
+IF NOT EXISTS (
+  SELECT 1 FROM {{ params['name'] }}.INFORMATION_SCHEMA.COLUMNS
+  WHERE table_name = 'all_clicks' AND clustering_ordinal_position IS NOT NULL) THEN
+  CREATE OR REPLACE TABLE
+    {{ params['name'] }}.all_clicks
+  PARTITION BY
+    click_date
+  CLUSTER BY
+    coop_campaign, user_pseudo_id
+  OPTIONS
+    (partition_expiration_days={{ params['coop_max_backfill'] }} + 30)
+  AS
+  SELECT * FROM {{ params['name'] }}.all_clicks;
+END IF;
 
+{% include 'load_retailer_tables.sql' %}
@@ -14,36 +14,74 @@
 
 import os
 import requests
-from flask import Flask, Response
+from flask import Flask, Response, request
 from google.auth.transport.requests import Request
 from google.oauth2 import id_token
 
 app = Flask(__name__)
+CHUNK_SIZE = 64 * 1024
 
-def make_iap_request(url, client_id, method='GET'):
+def make_iap_request(url, client_id, method='GET', headers=None):
     '''Makes a request to an application protected by Identity-Aware Proxy.
+    The body is not read, so it can be streamed to the client.
 
     Args:
       url: The Identity-Aware Proxy-protected URL to fetch.
       client_id: The client ID used by Identity-Aware Proxy.
       method: The http request method to use.
+      headers: Additional request headers, e.g. If-None-Match.
 
     Returns:
-      The page body, or raises an exception if the page couldn't be retrieved.
+      The response, or raises an exception if the page couldn't be retrieved.
     '''
 
     open_id_connect_token = id_token.fetch_id_token(Request(), client_id)
-    headers = {'Authorization': 'Bearer {}'.format(open_id_connect_token)}
-    resp = requests.request(method, url, headers=headers, timeout=90)
+    headers = dict(headers or {})
+    headers['Authorization'] = 'Bearer {}'.format(open_id_connect_token)
+    resp = requests.request(method, url, headers=headers, timeout=90, stream=True)
     if resp.status_code == 403:
         raise Exception('Service account does not have permission to '
                         'access the IAP-protected application.')
-    elif resp.status_code != 200:
+    elif resp.status_code not in (200, 304):
         raise Exception(
             'Bad response from application: {!r} / {!r} / {!r}'.format(
                 resp.status_code, resp.headers, resp.text))
     else:
-        return resp.text
+        return resp
+
+def proxy_conversions(path):
+    '''Streams a conversions export of the API service, forwarding the
+    If-None-Match header and passing the ETag back.
+
+    Args:
+      path: The API service path of the export, with its query string.
+
+    Returns:
+      The streamed csv response, a 304 if it was not modified.
+    '''
+
+    IAP_CLIENT_ID = os.environ.get('IAP_CLIENT_ID')
+    PROJECT_ID = os.environ.get('GOOGLE_CLOUD_PROJECT')
+    URL = f'https://api-service-dot-{PROJECT_ID}.appspot.com{path}'
+
+    headers = {}
+    if request.headers.get('If-None-Match'):
+        headers['If-None-Match'] = request.headers['If-None-Match']
+    try:
+        conversions = make_iap_request(URL, IAP_CLIENT_ID, headers=headers)
+    except Exception as error:
+        return f'Failed to get conversions: {error}', 500
+    if conversions.status_code == 304:
+        conversions.close()
+        response = Response(status=304)
+    else:
+        response = Response(response=conversions.iter_content(CHUNK_SIZE),
+                            status=200, mimetype='text/csv')
+        response.call_on_close(conversions.close)
+    for header in ('ETag', 'Cache-Control'):
+        if header in conversions.headers:
+            response.headers[header] = conversions.headers[header]
+    return response
 
 @app.route('/google_ads_conversions/<string:name>', methods=['GET'])
 def get_ads_conversions(name):
@@ -54,22 +92,31 @@ def get_ads_conversions(name):
         name (str): The Co-Op Configuration name.
 
         Returns:
-        conversions (str): a list of Google Ads conversions in csv format.
+        conversions (str): a list of Google Ads conversions in csv format,
+        streamed from the API service as it is received. The If-None-Match
+        header is forwarded, so unchanged conversions get a 304 with no body.
     '''
 
-    IAP_CLIENT_ID = os.environ.get('IAP_CLIENT_ID')
-    PROJECT_ID = os.environ.get('GOOGLE_CLOUD_PROJECT')
-    URL = f'https://api-service-dot-{PROJECT_ID}.appspot.com' \
-          f'/api/scheduler/get_google_ads_conversions/{name}'
+    return proxy_conversions(f'/api/scheduler/get_google_ads_conversions/{name}')
 
-    try:
-        conversions = make_iap_request(URL, IAP_CLIENT_ID)
-    except Exception as error:
-        return f'Failed to get conversions: {error}', 500
-    response = Response(response=conversions,
-                        status=200, mimetype='text/csv')
-    return response
+@app.route('/google_ads_bulk_conversions', methods=['GET'])
+def get_ads_bulk_conversions():
+    '''Endpoint to retrieve the Google Ads conversions of several Co-Op
+    Configurations in a single export.
+
+        Query params:
+        name (str): Repeatable, the Co-Op Configuration names.
+        customer_id (str): The Google Ads customer id, exports all its Co-Op
+        Configurations when no name is sent.
+        format (str): Optional, "combined" or "sections".
+
+        Returns:
+        conversions (str): the Google Ads conversions in csv format, streamed
+        from the API service as it is received.
+    '''
 
+    query_string = request.query_string.decode('utf-8')
+    return proxy_conversions(f'/api/scheduler/get_google_ads_bulk_conversions?{query_string}')
 
 if __name__ == '__main__':
     app.run(host='127.0.0.1', port=8080, debug=True)
@@ -0,0 +1,95 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''Checks that a running backfill keeps saving its progress while a chunk runs.
+
+Run from the backend folder with:
+
+    python -m unittest discover -s tests -t .
+'''
+
+import logging
+import threading
+import time
+import unittest
+from unittest import mock
+
+# The services create their Google Cloud clients when the core package is imported.
+mock.patch('google.cloud.logging.Client', **{
+    'return_value.get_default_handler.return_value': logging.NullHandler()}).start()
+for client in ('google.cloud.datastore.Client', 'google.cloud.bigquery.Client'):
+    mock.patch(client).start()
+
+from core.services import backfill_service
+from core.services.backfill_service import BackfillService
+
+RETAILER = {
+    'name': 'retailer',
+    'time_zone': 'UTC',
+    'coop_max_backfill': 30
+}
+
+class FakeDatastoreClient():
+
+    def __init__(self):
+        self.entities = {}
+        self.saves = 0
+
+    def get_by_name(self, model_type, name):
+        return self.entities.get(name)
+
+    def put(self, model_type, model_params):
+        self.saves += 1
+        self.entities[model_params['name']] = dict(
+            model_params, chunks=[dict(chunk) for chunk in model_params['chunks']])
+
+class SlowBigqueryService():
+    '''Loads every chunk in a given time.'''
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.finished = threading.Event()
+
+    def backfill(self, retailer_config, from_date, to_date):
+        time.sleep(self.seconds)
+
+    def update_coop_batch(self, retailer_config, coop_configs):
+        self.finished.set()
+        return {}
+
+class BackfillHeartbeatTest(unittest.TestCase):
+
+    @mock.patch.object(backfill_service, 'BACKFILL_HEARTBEAT_SECONDS', 0.05)
+    def test_long_chunk_saves_heartbeats(self):
+        ds_client = FakeDatastoreClient()
+        bq_client = SlowBigqueryService(0.5)
+        service = BackfillService(bq_client, ds_client)
+
+        backfill = service.start(RETAILER, [{'name': 'coop'}], chunk_days=30, max_workers=1)
+        self.assertEqual(len(backfill['chunks']), 1)
+        self.assertTrue(bq_client.finished.wait(5))
+        time.sleep(0.1)
+
+        # The start, several heartbeats, the chunk and the end are saved.
+        self.assertGreater(ds_client.saves, 5)
+        self.assertEqual(ds_client.entities['retailer']['status'], 'done')
+
+    def test_running_backfill_with_recent_save_is_not_stale(self):
+        service = BackfillService(None, FakeDatastoreClient())
+        backfill = {'status': 'running', 'modified_at': backfill_service.datetime.now(backfill_service.timezone.utc)}
+
+        self.assertFalse(service.is_stale(backfill))
+
+if __name__ == '__main__':
+    unittest.main()
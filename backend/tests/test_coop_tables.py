@@ -0,0 +1,81 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''Checks the partition expiration of the coop tables built by every path.
+
+Run from the backend folder with:
+
+    python -m unittest discover -s tests -t .
+'''
+
+import logging
+import unittest
+from unittest import mock
+
+# The services create their Google Cloud clients when the core package is imported.
+mock.patch('google.cloud.logging.Client', **{
+    'return_value.get_default_handler.return_value': logging.NullHandler()}).start()
+for client in ('google.cloud.datastore.Client', 'google.cloud.bigquery.Client'):
+    mock.patch(client).start()
+
+from core.services.bigquery_service import BigqueryService
+from core.services.coop_service import CoopService
+
+RETAILER = {
+    'name': 'retailer',
+    'coop_max_backfill': 150
+}
+COOP_CONFIG = {
+    'name': 'coop',
+    'retailer_name': 'retailer',
+    'attribution_window': 30,
+    'utm_campaigns': ['campaign'],
+    'filters': [],
+    'is_active': True
+}
+
+class CoopTablesExpirationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.bq_client = BigqueryService()
+        self.bq_client.client = mock.Mock(**{'query.return_value.result.return_value': []})
+
+    def rendered_query(self):
+        return self.bq_client.client.query.call_args.args[0]
+
+    def test_batch_uses_the_retailer_coop_max_backfill(self):
+        self.bq_client.update_coop_batch(RETAILER, [dict(COOP_CONFIG, incremental=False)])
+
+        self.assertIn('partition_expiration_days=150', self.rendered_query())
+
+    def test_create_config_uses_the_retailer_coop_max_backfill(self):
+        coop_service = CoopService()
+        coop_service.bq_client = self.bq_client
+        coop_service.ds_client = mock.Mock()
+        coop_service.ds_client.get_by_name.return_value = RETAILER
+        model = mock.Mock(**{'dict.return_value': COOP_CONFIG})
+        model.__class__.__name__ = 'CoopCampaignConfig'
+
+        coop_service.create_config(model)
+
+        self.assertIn('partition_expiration_days=150', self.rendered_query())
+
+    def test_coop_build_without_coop_max_backfill_fails(self):
+        with self.assertRaises(ValueError):
+            self.bq_client.create('CoopCampaignConfig', COOP_CONFIG)
+
+        self.bq_client.client.query.assert_not_called()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''Checks that invalid pagination params of the list endpoints are client errors.
+
+Run from the backend folder with:
+
+    python -m unittest discover -s tests -t .
+'''
+
+import logging
+import unittest
+from unittest import mock
+
+# The services create their Google Cloud clients when the core package is imported.
+mock.patch('google.cloud.logging.Client', **{
+    'return_value.get_default_handler.return_value': logging.NullHandler()}).start()
+for client in ('google.cloud.datastore.Client', 'google.cloud.bigquery.Client'):
+    mock.patch(client).start()
+
+from google.auth.credentials import AnonymousCredentials
+from google.cloud.datastore.client import Client
+from werkzeug.datastructures import MultiDict
+import utils
+from core.exceptions.coop_exception import CoopException
+from core.services.datastore_service import DatastoreClient
+
+class ListParamsTest(unittest.TestCase):
+
+    def test_page_size(self):
+        self.assertEqual(utils.get_list_params(MultiDict({'page_size': '5'}))['page_size'], 5)
+        self.assertIsNone(utils.get_list_params(MultiDict())['page_size'])
+
+    def test_invalid_page_size_is_a_bad_request(self):
+        for page_size in ('abc', '0', '-3', '2.5'):
+            with self.assertRaises(CoopException) as context:
+                utils.get_list_params(MultiDict({'page_size': page_size}))
+            self.assertEqual(context.exception.status_code, 400)
+
+    def test_malformed_page_token_is_a_bad_request(self):
+        ds_client = DatastoreClient()
+        # The cursor is decoded before any request is sent.
+        ds_client.client = Client(project='test', credentials=AnonymousCredentials())
+
+        with self.assertRaises(CoopException) as context:
+            ds_client.get_page('RetailerConfig', page_size=10, page_token='not a cursor!')
+        self.assertEqual(context.exception.status_code, 400)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''Renders the push query with the params the dispatcher sends to BigQuery.
+
+Run from the backend folder with:
+
+    python -m unittest discover -s tests -t .
+'''
+
+import logging
+import unittest
+from unittest import mock
+
+# The services create their Google Cloud clients when the core package is imported.
+mock.patch('google.cloud.logging.Client', **{
+    'return_value.get_default_handler.return_value': logging.NullHandler()}).start()
+for client in ('google.cloud.datastore.Client', 'google.cloud.bigquery.Client'):
+    mock.patch(client).start()
+
+from core.exceptions.coop_exception import CoopException
+from core.models.destinations import Dv360Destination, GoogleAdsApiDestination
+from core.services.coop_service import CoopService
+from core.services.sql_template_registry import registry
+
+RETAILER = {
+    'name': 'retailer',
+    'time_zone': 'America/New_York',
+    'currency': 'USD'
+}
+COOP_CONFIG = {
+    'name': 'coop',
+    'retailer_name': 'retailer',
+    'is_active': True,
+    'destinations': [
+        {'type': 'google_ads_api', 'customer_id': '123-456-7890'},
+        {'type': 'dv360', 'cm_profile_id': '1234567', 'floodlight_activity_id': '1234567',
+         'floodlight_configuration_id': '1234567'}
+    ]
+}
+
+class FakeBigqueryService():
+    '''Renders the queries instead of running them.'''
+
+    def __init__(self):
+        self.queries = []
+
+    def iter_table_batches(self, sql_file, query_params, batch_size=None, max_queue_size=None):
+        self.queries.append(registry.render(sql_file, query_params))
+        yield from ()
+
+class FakeDestinationService():
+    batch_size = 2000
+
+    def prepare(self, model_config, destination):
+        pass
+
+    def upload_conversions(self, model_config, destination, record_batches):
+        return {'coop_config': model_config['name'], 'status': 'uploaded', 'conversions': len(list(record_batches))}
+
+class PushConversionsQueryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.bq_service = FakeBigqueryService()
+        self.coop_service = CoopService()
+        self.coop_service.ds_client = mock.Mock()
+        self.coop_service.ds_client.get_all.side_effect = lambda model_type: {
+            'RetailerConfig': [RETAILER],
+            'CoopCampaignConfig': [COOP_CONFIG]
+        }[model_type]
+        self.coop_service.destinations.register(GoogleAdsApiDestination, FakeDestinationService())
+        self.coop_service.destinations.register(Dv360Destination, FakeDestinationService())
+        self.coop_service.dispatcher.bq_service = self.bq_service
+
+    def test_push_query_has_retailer_time_zone_and_currency(self):
+        results = self.coop_service.push_conversions(destination_types=['google_ads_api'])
+
+        self.assertEqual([result['status'] for result in results], ['uploaded'])
+        self.assertEqual(len(self.bq_service.queries), 1)
+        query = self.bq_service.queries[0]
+        self.assertIn("TIMESTAMP(transaction_datetime, 'America/New_York')", query)
+        self.assertIn("'USD' AS currency_code", query)
+
+    def test_dv360_push_query_has_retailer_time_zone_and_currency(self):
+        results = self.coop_service.push_conversions(destination_types=['dv360'])
+
+        self.assertEqual([result['destination'] for result in results], ['dv360'])
+        self.assertEqual(len(self.bq_service.queries), 1)
+        query = self.bq_service.queries[0]
+        self.assertIn("TIMESTAMP(transaction_datetime, 'America/New_York')", query)
+        self.assertIn("'USD' AS currency_code", query)
+        self.assertIn('retailer.coop_dv360_uploads', query)
+
+    def test_dispatcher_rejects_params_without_retailer(self):
+        with self.assertRaises(CoopException):
+            self.coop_service.dispatcher.push_conversions(COOP_CONFIG)
+
+        self.assertEqual(self.bq_service.queries, [])
+
+    def test_push_conversions_without_retailer_fails_the_config(self):
+        self.coop_service.ds_client.get_all.side_effect = lambda model_type: {
+            'RetailerConfig': [],
+            'CoopCampaignConfig': [COOP_CONFIG]
+        }[model_type]
+
+        results = self.coop_service.push_conversions(destination_types=['google_ads_api'])
+
+        self.assertEqual([result['status'] for result in results], ['error'])
+        self.assertEqual(self.bq_service.queries, [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -39,4 +39,70 @@ def build_error(error):
         'message': message,
         'status_code': status_code
     }
-    return error
\ No newline at end of file
+    return error
+
+def get_positive_int_param(params, name, maximum=None):
+    """Parses an optional positive integer param, e.g. max_workers,
+    from the query params or a JSON body.
+
+    Args:
+        params: The request query params or the JSON body.
+        name (str): The param name.
+        maximum (int): Optional largest accepted value.
+
+    Returns:
+        value (int): The param value, None if it was not sent.
+
+    Raises:
+        CoopException: 400 if the value is not an integer between 1 and maximum.
+    """
+    # Imported here, the core package imports this module when it starts.
+    from core.exceptions.coop_exception import CoopException
+    value = params.get(name)
+    if value is None:
+        return None
+    if isinstance(value, str) and value.strip().lstrip('-').isdigit():
+        value = int(value)
+    if isinstance(value, bool) or not isinstance(value, int) or value < 1 \
+            or (maximum is not None and value > maximum):
+        bounds = f'between 1 and {maximum}' if maximum is not None else 'greater than 0'
+        raise CoopException(f'{name} must be an integer {bounds}.', status_code=400)
+    return value
+
+def get_list_params(args):
+    """Parses the pagination, filter and projection query params
+    of the list endpoints.
+
+    Args:
+        args: The request query params.
+
+    Returns:
+        params (dict): page_size, page_token, is_active and fields, None
+        if the query param was not sent.
+
+    Raises:
+        CoopException: 400 if the page_size is not a positive integer.
+    """
+    is_active = args.get('is_active')
+    fields = args.get('fields')
+    return {
+        'page_size': get_positive_int_param(args, 'page_size'),
+        'page_token': args.get('page_token'),
+        'is_active': is_active.lower() == 'true' if is_active is not None else None,
+        'fields': [field.strip() for field in fields.split(',') if field.strip()] if fields else None
+    }
+
+def get_bulk_format(request):
+    """Gets the bulk import/export format from the format query param
+    or the request content type, NDJSON by default.
+
+    Args:
+        request: The flask request.
+
+    Returns:
+        data_format (str): ndjson or csv.
+    """
+    data_format = request.args.get('format')
+    if not data_format:
+        data_format = 'csv' if request.mimetype == 'text/csv' else 'ndjson'
+    return 'csv' if data_format.lower() == 'csv' else 'ndjson'
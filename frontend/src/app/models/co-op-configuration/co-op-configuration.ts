@@ -1,5 +1,6 @@
 import { Filter } from './filter';
 import { GoogleAdsDestination } from './google-ads-destination';
+import { GoogleAdsApiDestination } from './google-ads-api-destination';
 import { DV360Destination } from './dv360-destination';
 
 export interface CoopConfiguration {
@@ -8,7 +9,7 @@ export interface CoopConfiguration {
     attribution_window: number
     filters: Array<Filter>
     utm_campaigns: Array<string>
-    destinations: Array<GoogleAdsDestination|DV360Destination>
+    destinations: Array<GoogleAdsDestination|GoogleAdsApiDestination|DV360Destination>
     is_active: boolean
     created_at?: string
     modified_at?: string
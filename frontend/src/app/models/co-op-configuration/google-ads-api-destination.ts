@@ -0,0 +1,5 @@
+export interface GoogleAdsApiDestination {
+    type: string
+    customer_id: string
+    login_customer_id?: string
+}
\ No newline at end of file
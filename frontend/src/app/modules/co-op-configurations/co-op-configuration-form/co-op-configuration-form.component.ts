@@ -28,6 +28,7 @@ import { RetailersService } from '../../retailers/services/retailers.service';
 import { Retailer } from '../../../models/retailer/retailer';
 import { Filter } from '../../../models/co-op-configuration/filter';
 import { GoogleAdsDestination } from '../../../models/co-op-configuration/google-ads-destination';
+import { GoogleAdsApiDestination } from '../../../models/co-op-configuration/google-ads-api-destination';
 import { DV360Destination } from '../../../models/co-op-configuration/dv360-destination';
 import { MatSnackBar } from '@angular/material/snack-bar';
 import { MatOptionSelectionChange } from '@angular/material/core/option';
@@ -129,6 +130,7 @@ export class CoopConfigurationFormComponent implements OnInit {
     return new FormGroup({
       'types': new FormControl([], [Validators.required]),
       'google_ads': new FormGroup({}),
+      'google_ads_api': new FormGroup({}),
       'dv360': new FormGroup({})
     })
   }
@@ -176,6 +178,9 @@ export class CoopConfigurationFormComponent implements OnInit {
     return [{
       'value': 'google_ads',
       'label': "Google Ads"
+    }, {
+      'value': 'google_ads_api',
+      'label': "Google Ads API"
     }, {
       'value': 'dv360',
       'label': 'DV360/CM'
@@ -223,7 +228,7 @@ export class CoopConfigurationFormComponent implements OnInit {
     return formFilters
   }
 
-  buildFormDestinationValues(destinations: Array<GoogleAdsDestination | DV360Destination>) {
+  buildFormDestinationValues(destinations: Array<GoogleAdsDestination | GoogleAdsApiDestination | DV360Destination>) {
     let destinationTypes: string[] = [];
     let formDestinations: any = {};
     destinations.forEach((destination) => {
@@ -235,6 +240,12 @@ export class CoopConfigurationFormComponent implements OnInit {
             'customer_id': (<GoogleAdsDestination>destination).customer_id
           };
           break;
+        case 'google_ads_api':
+          formDestinations[destination.type] = {
+            'customer_id': (<GoogleAdsApiDestination>destination).customer_id,
+            'login_customer_id': (<GoogleAdsApiDestination>destination).login_customer_id || ''
+          };
+          break;
         case 'dv360':
           formDestinations[destination.type] = {
             'cm_profile_id': (<DV360Destination>destination).cm_profile_id,
@@ -309,8 +320,8 @@ export class CoopConfigurationFormComponent implements OnInit {
     return filters
   }
 
-  buildCoopConfigurationDestinations(): Array<GoogleAdsDestination | DV360Destination> {
-    let destinations: Array<GoogleAdsDestination | DV360Destination> = [];
+  buildCoopConfigurationDestinations(): Array<GoogleAdsDestination | GoogleAdsApiDestination | DV360Destination> {
+    let destinations: Array<GoogleAdsDestination | GoogleAdsApiDestination | DV360Destination> = [];
     let destinationTypes = this.coopConfigurationForm.get('destinations.types')?.value;
     destinationTypes.forEach((destinationType: string) => {
       let params = this.coopConfigurationForm.get(`destinations.${destinationType}`)?.value;
@@ -321,6 +332,16 @@ export class CoopConfigurationFormComponent implements OnInit {
           googleAdsDestination.customer_id = params.customer_id;
           destinations.push(googleAdsDestination);
           break;
+        case 'google_ads_api':
+          let googleAdsApiDestination = {} as GoogleAdsApiDestination;
+          googleAdsApiDestination.type = destinationType;
+          googleAdsApiDestination.customer_id = params.customer_id;
+          // The manager account is optional, an empty one is not sent
+          if (params.login_customer_id) {
+            googleAdsApiDestination.login_customer_id = params.login_customer_id;
+          }
+          destinations.push(googleAdsApiDestination);
+          break;
         case 'dv360':
           let dv360Destination = {} as DV360Destination
           dv360Destination.type = destinationType;;
@@ -454,6 +475,12 @@ export class CoopConfigurationFormComponent implements OnInit {
           googleAdsDestination.customer_id = '';
           this.coopConfiguration.destinations.push(googleAdsDestination);
           break;
+        case 'google_ads_api':
+          let googleAdsApiDestination = {} as GoogleAdsApiDestination;
+          googleAdsApiDestination.type = destinationType;
+          googleAdsApiDestination.customer_id = '';
+          this.coopConfiguration.destinations.push(googleAdsApiDestination);
+          break;
         case 'dv360':
           let dv360Destination = {} as DV360Destination
           dv360Destination.type = destinationType;;
@@ -478,6 +505,16 @@ export class CoopConfigurationFormComponent implements OnInit {
             new FormControl('', [Validators.required, Validators.pattern('([0-9]{3})-([0-9]{3})-([0-9]{4})')]));
         }
         break;
+      case 'google_ads_api':
+        if (!this.coopConfigurationForm.get(formGroupName)?.get('customer_id')) {
+          (<FormGroup>this.coopConfigurationForm.get(formGroupName)).addControl('customer_id',
+            new FormControl('', [Validators.required, Validators.pattern('([0-9]{3})-([0-9]{3})-([0-9]{4})')]));
+        }
+        if (!this.coopConfigurationForm.get(formGroupName)?.get('login_customer_id')) {
+          (<FormGroup>this.coopConfigurationForm.get(formGroupName)).addControl('login_customer_id',
+            new FormControl('', [Validators.pattern('([0-9]{3})-([0-9]{3})-([0-9]{4})')]));
+        }
+        break;
       case 'dv360':
         if (!this.coopConfigurationForm.get(formGroupName)?.get('cm_profile_id')) {
           (<FormGroup>this.coopConfigurationForm.get(formGroupName)).addControl('cm_profile_id',